@@ -0,0 +1,114 @@
+"""Micro-benchmark for the current-map lookup
+
+Times the streaming MapLinkExtractor against the BeautifulSoup parse on
+saved copies of the Combat Box homepage, and counts what each allocates
+per poll. Both parsers must agree on every page. With no pages given it
+runs on benchmark_homepage.html, a trimmed stand-in for the homepage with
+the map link mid-page and the stats tables after it.
+
+    python benchmark_map_parser.py
+    python benchmark_map_parser.py page1.html page2.html
+    python benchmark_map_parser.py --save homepage.html   # save the live page first
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from map_link_parser import find_map_link, find_map_link_soup
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_homepage.html")
+
+
+def chunks_of(content, size=CHUNK_SIZE):
+    for start in range(0, len(content), size):
+        yield content[start:start + size]
+
+
+def parse_streaming(content):
+    return find_map_link(chunks_of(content))
+
+
+def parse_soup(content):
+    return find_map_link_soup(content.decode("utf-8", errors="replace"))
+
+
+PARSERS = {
+    "streaming": parse_streaming,
+    "soup": parse_soup,
+}
+
+
+def time_parser(parse, content, repeat):
+    """Best time over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(content)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def measure_allocations(parse, content):
+    """(peak bytes, allocated blocks) for one parse"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        parse(content)
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    return peak, blocks
+
+
+def save_page(url, path):
+    import requests
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    with open(path, 'wb') as f:
+        f.write(response.content)
+    print(f"Saved {len(response.content) / 1024:.1f} KiB from {url} to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pages", nargs="*", help=f"saved copies of the homepage (default: {os.path.basename(DEFAULT_PAGE)})")
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per parser and page")
+    parser.add_argument("--save", metavar="PATH", help="save the live homepage to PATH")
+    parser.add_argument("--url", default="https://combatbox.net/en/", help="page to save with --save")
+    args = parser.parse_args()
+
+    if args.save:
+        save_page(args.url, args.save)
+        args.pages.append(args.save)
+    if not args.pages:
+        args.pages = [DEFAULT_PAGE]
+
+    mismatches = 0
+    for path in args.pages:
+        with open(path, 'rb') as f:
+            content = f.read()
+        print(f"{path} ({len(content) / 1024:.1f} KiB)")
+
+        results = {}
+        for name, parse in PARSERS.items():
+            # The first run pays for imports and warms caches
+            results[name] = parse(content)
+            elapsed = time_parser(parse, content, args.repeat)
+            peak, blocks = measure_allocations(parse, content)
+            print(f"  {name:10} {elapsed:8.2f} ms  peak {peak / 1024:8.1f} KiB  {blocks:7d} blocks")
+
+        if len(set(results.values())) > 1:
+            mismatches += 1
+            print(f"  MISMATCH: {results}")
+        else:
+            print(f"  map link: {results['streaming']}")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
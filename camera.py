@@ -0,0 +1,147 @@
+import math
+
+
+class Camera:
+    """Moves a Viewport over time instead of in fixed steps per input event
+
+    Held pan keys and buttons set a direction the camera accelerates towards
+    until they are released, so panning speed is in pixels per second
+    whatever the frame rate or key repeat rate. Held zoom binds move the
+    zoom target at zoom_speed per second, and zoom steps (wheel notches,
+    first presses) move it by a fixed amount; the zoom eases towards it.
+    Direct pixel pans (mouse drag, analog sticks) bypass the animation.
+    """
+
+    def __init__(self, viewport, max_speed=1200, acceleration=6000, zoom_time=0.1, zoom_speed=1.0):
+        self.viewport = viewport
+        # Pan speed in pixels per second, and how fast it is reached or lost
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+        # Time constant of the zoom easing, in seconds
+        self.zoom_time = zoom_time
+        # How fast held zoom binds move the zoom target, in zoom units per second
+        self.zoom_speed = zoom_speed
+
+        self.velocity = [0.0, 0.0]
+        self.remainder = [0.0, 0.0]
+        # Direction of the pan keys and buttons held right now, set every frame
+        self.held_direction = (0, 0)
+        # Direction of one-off pan actions (a tap, a scripted step), used for one update
+        self.pushed_direction = (0, 0)
+        # +1 or -1 while a zoom bind is held, set every frame
+        self.held_zoom = 0
+        self.zoom_target = viewport.zoom
+
+    @property
+    def moving(self):
+        return bool(self.velocity[0] or self.velocity[1] or self.zoom_target != self.viewport.zoom)
+
+    def clamp_zoom(self, zoom):
+        return max(self.viewport.min_zoom, min(self.viewport.max_zoom, zoom))
+
+    def hold(self, dx, dy):
+        """Pan in direction (dx, dy), in offset terms, until a different direction is held"""
+        self.held_direction = (max(-1, min(1, dx)), max(-1, min(1, dy)))
+
+    def push(self, dx, dy):
+        """Pan in direction (dx, dy) for the next update only"""
+        self.pushed_direction = (
+            max(-1, min(1, self.pushed_direction[0] + dx)), max(-1, min(1, self.pushed_direction[1] + dy)))
+
+    def hold_zoom(self, direction):
+        """Zoom in (1) or out (-1) at zoom_speed until a different direction is held"""
+        self.held_zoom = max(-1, min(1, direction))
+
+    def zoom_by(self, delta):
+        """Ease towards a zoom delta away from the current target"""
+        self.zoom_target = self.clamp_zoom(self.zoom_target + delta)
+
+    def zoom_now(self, delta):
+        """Zoom immediately, for inputs that are already scaled by frame time"""
+        before = self.viewport.zoom
+        self.viewport.zoom_by(delta)
+        self.zoom_target = self.clamp_zoom(self.zoom_target + self.viewport.zoom - before)
+
+    def reset(self):
+        self.viewport.reset()
+        self.velocity = [0.0, 0.0]
+        self.remainder = [0.0, 0.0]
+        self.held_direction = (0, 0)
+        self.pushed_direction = (0, 0)
+        self.held_zoom = 0
+        self.zoom_target = self.viewport.zoom
+
+    def jump_to(self, zoom, x_offset, y_offset):
+        """Move straight to a view, e.g. one restored from the last session"""
+        self.reset()
+        self.viewport.zoom = self.clamp_zoom(zoom)
+        self.viewport.x_offset = x_offset
+        self.viewport.y_offset = y_offset
+        self.viewport.constrain()
+        self.zoom_target = self.viewport.zoom
+
+    def update(self, dt):
+        """Advance the animation by dt seconds"""
+        direction = (
+            max(-1, min(1, self.held_direction[0] + self.pushed_direction[0])),
+            max(-1, min(1, self.held_direction[1] + self.pushed_direction[1])))
+        self.pushed_direction = (0, 0)
+        self.update_pan(direction, dt)
+        if self.held_zoom:
+            self.zoom_target = self.clamp_zoom(self.zoom_target + self.held_zoom * self.zoom_speed * dt)
+        self.update_zoom(dt)
+
+    def update_pan(self, direction, dt):
+        # Diagonals move at the same speed as straight pans
+        length = math.hypot(direction[0], direction[1])
+        target = (0.0, 0.0)
+        if length:
+            target = (direction[0] / length * self.max_speed, direction[1] / length * self.max_speed)
+
+        # Accelerate towards the target velocity, at most acceleration * dt this frame
+        diff_x = target[0] - self.velocity[0]
+        diff_y = target[1] - self.velocity[1]
+        diff = math.hypot(diff_x, diff_y)
+        step = self.acceleration * dt
+        if diff <= step:
+            self.velocity = list(target)
+        else:
+            self.velocity[0] += diff_x / diff * step
+            self.velocity[1] += diff_y / diff * step
+
+        if not self.velocity[0] and not self.velocity[1]:
+            self.remainder = [0.0, 0.0]
+            return
+
+        # Whole pixels move the view; the fraction carries to the next frame
+        self.remainder[0] += self.velocity[0] * dt
+        self.remainder[1] += self.velocity[1] * dt
+        dx = int(self.remainder[0])
+        dy = int(self.remainder[1])
+        self.remainder[0] -= dx
+        self.remainder[1] -= dy
+        if not dx and not dy:
+            return
+
+        before = (self.viewport.x_offset, self.viewport.y_offset)
+        self.viewport.pan(dx, dy)
+        # Stop dead against the map edge instead of pushing into it
+        if dx and self.viewport.x_offset == before[0]:
+            self.velocity[0] = 0.0
+            self.remainder[0] = 0.0
+        if dy and self.viewport.y_offset == before[1]:
+            self.velocity[1] = 0.0
+            self.remainder[1] = 0.0
+
+    def update_zoom(self, dt):
+        zoom = self.viewport.zoom
+        if zoom == self.zoom_target:
+            return
+        # Exponential ease: the same fraction of the gap closes per second at any frame rate
+        new_zoom = self.zoom_target + (zoom - self.zoom_target) * math.exp(-dt / self.zoom_time)
+        if abs(new_zoom - self.zoom_target) < 0.001:
+            new_zoom = self.zoom_target
+        self.viewport.zoom_to(new_zoom)
+        if self.viewport.zoom != new_zoom:
+            # The viewport clamped it; don't chase a zoom it won't take
+            self.zoom_target = self.viewport.zoom
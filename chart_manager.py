@@ -1,21 +1,304 @@
 import pygame
 import math
+import numpy as np
+from text_cache import text_cache
+from spatial_index import GridIndex
+
+
+def leg_headings(points):
+    """Headings (North=0, clockwise) of every leg of a route, as an array"""
+    deltas = np.diff(points, axis=0)
+    # Negative dy because pygame y increases downward
+    return (90 - np.degrees(np.arctan2(-deltas[:, 1], deltas[:, 0]))) % 360
+
+
+def leg_distances(points):
+    """Length of every leg of a route in map pixels"""
+    deltas = np.diff(points, axis=0)
+    return np.hypot(deltas[:, 0], deltas[:, 1])
+
+
+def simplify_polyline(points, tolerance):
+    """Douglas-Peucker simplification; returns the indices of the points to keep"""
+    count = len(points)
+    if count < 3 or tolerance <= 0:
+        return np.arange(count)
+
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        start = points[first]
+        segment = points[last] - start
+        offsets = points[first + 1:last] - start
+        length = math.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return np.flatnonzero(keep)
+
 
 class ChartManager:
+    POINT_RADIUS = 5
+    # Largest deviation, in screen pixels, a simplified route may have from the real one
+    SIMPLIFY_TOLERANCE = 1.0
+    # Zoom levels per doubling that share one simplified route
+    ZOOM_BUCKETS_PER_OCTAVE = 4
+    # Routes with more waypoints than this are simplified, and their labels culled, when drawn
+    DETAIL_LIMIT = 500
+    # How close, in screen pixels, a click must be to pick a waypoint or leg
+    PICK_RADIUS = 8
+
     def __init__(self):
-        self.points = []
+        # Waypoints live in a preallocated (capacity, 2) array that grows geometrically.
+        # Index i of the leg arrays describes the leg that ends at point i.
+        self.point_count = 0
+        self._points = np.empty((16, 2), dtype=np.float64)
+        self._headings = np.zeros(16, dtype=np.float64)
+        self._leg_lengths = np.zeros(16, dtype=np.float64)
+        # Stable ids survive inserts and deletes; the spatial indexes are keyed by them.
+        # A leg is keyed by the id of the waypoint it ends at.
+        self._ids = np.zeros(16, dtype=np.int64)
+        self.next_id = 0
+        self.point_index = GridIndex()
+        self.leg_index = GridIndex()
+        # Rendered heading label for each leg, made the first time the leg is
+        # drawn with a label and dropped when the leg changes
+        self.labels = []
+        self._label_size = None
         self.chart_mode = False
-        self.font = pygame.font.Font(None, 24)
+        # Bumped whenever the route changes, so the viewer knows to redraw
+        self.revision = 0
+
+        # Editing state
+        self.selected_id = None
+        self.dragging = False
+
+        # Simplified routes per zoom bucket, valid for simplified_revision
+        self.simplified = {}
+        self.simplified_revision = None
+
+        # Route drawn at the last zoom and the area it covers, in map pixels at
+        # that zoom; reused until the route or zoom changes or a pan leaves it
+        self.overlay = None
+        self.overlay_area = None
+        self.overlay_key = None
+
+    @property
+    def points(self):
+        return self._points[:self.point_count]
+
+    @property
+    def headings(self):
+        return self._headings[1:self.point_count]
+
+    @property
+    def leg_lengths(self):
+        return self._leg_lengths[1:self.point_count]
+
+    def cumulative_distances(self):
+        """Distance along the route to each waypoint, starting at 0"""
+        return np.cumsum(self._leg_lengths[:self.point_count])
+
+    def ensure_capacity(self, count):
+        capacity = len(self._points)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        self._points = np.resize(self._points, (capacity, 2))
+        self._headings = np.resize(self._headings, capacity)
+        self._leg_lengths = np.resize(self._leg_lengths, capacity)
+        self._ids = np.resize(self._ids, capacity)
+
+    def index_of(self, point_id):
+        """Current position of a waypoint id, or None if it no longer exists"""
+        matches = np.flatnonzero(self._ids[:self.point_count] == point_id)
+        return int(matches[0]) if len(matches) else None
+
+    @property
+    def label_size(self):
+        """Longest side of any heading label, measured once from the widest one"""
+        if self._label_size is None:
+            self._label_size = max(text_cache.get_font(24).size("888.8°"))
+        return self._label_size
+
+    def label(self, leg):
+        """Heading label for the leg ending at point leg + 1, rendered on first use
+
+        Rendered with the font directly rather than through the shared text
+        cache, which a long route would otherwise flush of all the UI text.
+        """
+        label = self.labels[leg]
+        if label is None:
+            label = text_cache.get_font(24).render(f"{self._headings[leg + 1]:.1f}°", True, (0, 0, 255))
+            self.labels[leg] = label
+        return label
+
+    def refresh_legs(self, first, last):
+        """Recompute heading, length and index entry for legs ending at first..last, and drop their labels"""
+        first = max(first, 1)
+        last = min(last, self.point_count - 1)
+        if last < first:
+            return
+        legs = self._points[first - 1:last + 1]
+        headings = leg_headings(legs)
+        self._headings[first:last + 1] = headings
+        self._leg_lengths[first:last + 1] = leg_distances(legs)
+        self.labels[first - 1:last] = [None] * (last - first + 1)
+        for i in range(first, last + 1):
+            (x1, y1), (x2, y2) = self._points[i - 1].tolist(), self._points[i].tolist()
+            self.leg_index.insert_segment(int(self._ids[i]), x1, y1, x2, y2)
+
+    def add_points(self, map_points):
+        """Append a batch of waypoints, e.g. an imported track"""
+        new_points = np.asarray(map_points, dtype=np.float64).reshape(-1, 2)
+        if not len(new_points):
+            return
+
+        start = self.point_count
+        end = start + len(new_points)
+        self.ensure_capacity(end)
+        self._points[start:end] = new_points
+        self._headings[start] = 0.0
+        self._leg_lengths[start] = 0.0
+        self._ids[start:end] = np.arange(self.next_id, self.next_id + len(new_points))
+        self.next_id += len(new_points)
+        for point_id, (x, y) in zip(self._ids[start:end].tolist(), new_points.tolist()):
+            self.point_index.insert_point(point_id, x, y)
 
-    def calculate_heading(self, p1, p2):
-        dx = p2[0] - p1[0]
-        dy = -(p2[1] - p1[1])  # Negative because pygame y increases downward
-        heading = math.degrees(math.atan2(dy, dx))  # Swapped dx/dy for North=0
-        heading = (90 - heading) % 360  # Adjust to make North=0
-        return heading
+        # Legs from the previous last point (if any) through the new points
+        self.point_count = end
+        self.labels.extend([None] * (end - max(start, 1)))
+        self.refresh_legs(start, end - 1)
+        self.revision += 1
 
-    def handle_click(self, event, screen_pos, map_pos):
-        if not self.chart_mode or event.type != pygame.MOUSEBUTTONDOWN:
+    def add_point(self, map_pos):
+        self.add_points([map_pos])
+
+    def insert_point(self, index, map_pos):
+        """Insert a waypoint before position index and return its id"""
+        count = self.point_count
+        self.ensure_capacity(count + 1)
+        for array in (self._points, self._headings, self._leg_lengths, self._ids):
+            array[index + 1:count + 1] = array[index:count]
+        self._points[index] = map_pos
+        point_id = self.next_id
+        self.next_id += 1
+        self._ids[index] = point_id
+        self.point_index.insert_point(point_id, map_pos[0], map_pos[1])
+
+        if count >= 1:
+            self.labels.insert(max(index - 1, 0), None)
+        self.point_count = count + 1
+        self._headings[0] = self._leg_lengths[0] = 0.0
+        self.refresh_legs(index, index + 1)
+        self.revision += 1
+        return point_id
+
+    def delete_point(self, index):
+        count = self.point_count
+        point_id = int(self._ids[index])
+        self.point_index.remove(point_id)
+        self.leg_index.remove(point_id)
+        for array in (self._points, self._headings, self._leg_lengths, self._ids):
+            array[index:count - 1] = array[index + 1:count]
+        self.point_count = count - 1
+
+        if self.labels:
+            del self.labels[max(index - 1, 0)]
+        if index == 0 and self.point_count:
+            # The old second point now starts the route, so no leg ends at it
+            self.leg_index.remove(int(self._ids[0]))
+        self._headings[0] = self._leg_lengths[0] = 0.0
+        self.refresh_legs(index, index)
+        if self.selected_id == point_id:
+            self.selected_id = None
+        self.revision += 1
+
+    def delete_leg(self, index):
+        """Remove the leg ending at index along with both of its waypoints"""
+        self.delete_point(index)
+        self.delete_point(index - 1)
+
+    def move_point(self, index, map_pos):
+        self._points[index] = map_pos
+        self.point_index.insert_point(int(self._ids[index]), map_pos[0], map_pos[1])
+        self.refresh_legs(index, index + 1)
+        self.revision += 1
+
+    def clear_points(self):
+        self.point_count = 0
+        self.labels.clear()
+        self.point_index.clear()
+        self.leg_index.clear()
+        self.selected_id = None
+        self.dragging = False
+        self.revision += 1
+
+    def pick_point(self, map_pos, radius):
+        """Index of the nearest waypoint within radius (map pixels), or None"""
+        candidates = [self.index_of(point_id)
+                      for point_id in self.point_index.query(map_pos[0], map_pos[1], radius)]
+        if not candidates:
+            return None
+        candidates = np.array(candidates)
+        offsets = self._points[candidates] - map_pos
+        distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        nearest = int(np.argmin(distances))
+        return int(candidates[nearest]) if distances[nearest] <= radius else None
+
+    def pick_leg(self, map_pos, radius):
+        """Index of the end waypoint of the nearest leg within radius, or None"""
+        candidates = [self.index_of(point_id)
+                      for point_id in self.leg_index.query(map_pos[0], map_pos[1], radius)]
+        if not candidates:
+            return None
+        candidates = np.array(candidates)
+        starts = self._points[candidates - 1]
+        segments = self._points[candidates] - starts
+        lengths_sq = np.maximum((segments ** 2).sum(axis=1), 1e-12)
+        t = np.clip(((np.asarray(map_pos) - starts) * segments).sum(axis=1) / lengths_sq, 0, 1)
+        closest = starts + segments * t[:, None]
+        distances = np.hypot(*(closest - map_pos).T)
+        nearest = int(np.argmin(distances))
+        return int(candidates[nearest]) if distances[nearest] <= radius else None
+
+    def handle_click(self, event, screen_pos, map_pos, scale=1.0):
+        """Edit the route
+
+        Left click picks and drags a waypoint, inserts one on a leg, or
+        appends one elsewhere. Right click deletes the waypoint or leg under
+        the cursor, or leaves chart mode. Middle click clears the route.
+        """
+        if not self.chart_mode:
+            return False
+
+        if event.type == pygame.MOUSEMOTION:
+            if self.dragging and self.selected_id is not None:
+                index = self.index_of(self.selected_id)
+                if index is not None:
+                    self.move_point(index, map_pos)
+                return True
+            return False
+        if event.type == pygame.MOUSEBUTTONUP:
+            if event.button == 1 and self.dragging:
+                self.dragging = False
+                return True
+            return False
+        if event.type != pygame.MOUSEBUTTONDOWN:
             return False
 
         if not hasattr(self, 'activated'):
@@ -23,41 +306,144 @@ class ChartManager:
                 self.activated = True
             return True
 
+        radius = self.PICK_RADIUS / scale
         if event.button == 1:
-            self.points.append(map_pos)
+            index = self.pick_point(map_pos, radius)
+            if index is not None:
+                self.selected_id = int(self._ids[index])
+            else:
+                leg = self.pick_leg(map_pos, radius)
+                if leg is not None:
+                    self.selected_id = self.insert_point(leg, map_pos)
+                else:
+                    self.add_point(map_pos)
+                    self.selected_id = int(self._ids[self.point_count - 1])
+            self.dragging = True
             return True
         elif event.button == 2:
-            self.points.clear()
+            self.clear_points()
             return True
         elif event.button == 3:
+            index = self.pick_point(map_pos, radius)
+            if index is not None:
+                self.delete_point(index)
+                return True
+            leg = self.pick_leg(map_pos, radius)
+            if leg is not None:
+                self.delete_leg(leg)
+                return True
             self.chart_mode = False
             self.activated = False
+            self.dragging = False
             return True
         return False
 
-    def draw(self, screen, transform_point):
-        if not self.points:
+    def simplified_indices(self, scale):
+        """Indices of the waypoints worth drawing at this zoom, cached per zoom bucket"""
+        if self.simplified_revision != self.revision:
+            self.simplified.clear()
+            self.simplified_revision = self.revision
+
+        bucket = math.floor(math.log2(scale) * self.ZOOM_BUCKETS_PER_OCTAVE)
+        indices = self.simplified.get(bucket)
+        if indices is None:
+            # Use the largest zoom in the bucket so the error stays under tolerance across it
+            bucket_scale = 2 ** ((bucket + 1) / self.ZOOM_BUCKETS_PER_OCTAVE)
+            indices = simplify_polyline(self.points, self.SIMPLIFY_TOLERANCE / bucket_scale)
+            self.simplified[bucket] = indices
+        return indices
+
+    def draw(self, screen, viewport, moving=False):
+        """Draw the route through the viewport's map -> screen transform
+
+        The route is kept on an overlay in map pixels at the current zoom, so
+        a pan only moves it. The overlay is rebuilt when the route, selection,
+        zoom or screen size changes, or when the view pans past the area it
+        covers. While the camera is moving (e.g. mid zoom) and the overlay
+        is out of date, the route is drawn straight onto the screen instead
+        of building a new one every frame.
+        """
+        if not self.point_count:
+            return
+
+        scale, origin_x, origin_y = viewport.transform
+        screen_size = screen.get_size()
+        key = (self.revision, self.selected_id, scale, screen_size)
+        if key != self.overlay_key and moving:
+            self.render_route(screen, viewport.map_to_screen(self.points), scale)
+            return
+
+        # What the route needs of the screen, in map pixels at this zoom
+        needed = self.route_bounds(scale).clip(pygame.Rect((-origin_x, -origin_y), screen_size))
+        if not needed.width or not needed.height:
             return
+        if key != self.overlay_key or not self.overlay_area.contains(needed):
+            self.overlay, self.overlay_area = self.build_overlay(needed, screen_size, scale)
+            self.overlay_key = key
+        screen.blit(self.overlay, (origin_x + self.overlay_area.x, origin_y + self.overlay_area.y))
+
+    def route_bounds(self, scale):
+        """Bounds of the drawn route, markers and labels included, in map pixels at scale"""
+        margin = self.POINT_RADIUS + 2
+        if self.point_count > 1:
+            margin = max(margin, self.label_size)
+        points = self.points * scale
+        low = np.floor(points.min(axis=0)) - margin
+        high = np.floor(points.max(axis=0)) + margin + 1
+        return pygame.Rect(int(low[0]), int(low[1]), int(high[0] - low[0]), int(high[1] - low[1]))
+
+    def build_overlay(self, needed, screen_size, scale):
+        """Render the route onto a transparent surface covering needed plus half a screen around it
+
+        Returns the overlay and the area it covers, in map pixels at scale.
+        The extra half screen on each side lets short pans reuse it.
+        """
+        area = needed.inflate(screen_size[0], screen_size[1]).clip(self.route_bounds(scale))
+        overlay = pygame.Surface(area.size, pygame.SRCALPHA)
+        points = np.floor(self.points * scale).astype(np.int64) - area.topleft
+        self.render_route(overlay, points, scale)
+        return overlay, area
 
-        screen_points = [transform_point(p) for p in self.points]
+    def render_route(self, target, points, scale):
+        """Draw the route onto target, given its waypoints in target pixels
+
+        Every waypoint gets its marker and heading label. Only routes longer
+        than DETAIL_LIMIT are drawn from a copy simplified for the current
+        zoom, with labels kept to legs long enough on screen to hold one.
+        """
+        width, height = target.get_size()
+        detailed = self.point_count <= self.DETAIL_LIMIT
+        if detailed:
+            drawn_points = points
+        else:
+            drawn_points = points[self.simplified_indices(scale)]
+        # Drop points that land on the same pixel as the one before
+        if len(drawn_points) > 1:
+            moved = np.any(drawn_points[1:] != drawn_points[:-1], axis=1)
+            drawn_points = np.concatenate((drawn_points[:1], drawn_points[1:][moved]))
+        point_list = drawn_points.tolist()
 
         # Draw only the lines first
-        if len(screen_points) > 1:
+        if len(point_list) > 1:
             # Draw connecting lines
-            pygame.draw.lines(screen, (255, 0, 0), False, screen_points, 2)
-
-            # Draw only the heading numbers midway between points
-            for i in range(len(self.points) - 1):
-                mid_x = (screen_points[i][0] + screen_points[i + 1][0]) / 2
-                mid_y = (screen_points[i][1] + screen_points[i + 1][1]) / 2
-                mid_point = (int(mid_x), int(mid_y))
+            pygame.draw.lines(target, (255, 0, 0), False, point_list, 2)
 
-                # Only draw heading text at midpoint
-                heading = self.calculate_heading(self.points[i], self.points[i + 1])
-                text = self.font.render(f"{heading:.1f}°", True, (0, 0, 255))
-                text_rect = text.get_rect(center=mid_point)
-                screen.blit(text, text_rect)
+        # Draw the heading labels midway along legs that are visible and long enough
+        if self.point_count > 1:
+            midpoints = (points[:-1] + points[1:]) // 2
+            visible = (np.all(midpoints >= 0, axis=1) &
+                       (midpoints[:, 0] < width) & (midpoints[:, 1] < height))
+            if not detailed:
+                visible &= self.leg_lengths * scale >= self.label_size
+            for leg in np.flatnonzero(visible).tolist():
+                label = self.label(leg)
+                target.blit(label, label.get_rect(center=midpoints[leg].tolist()))
 
         # Draw the points last
-        for point in screen_points:
-            pygame.draw.circle(screen, (255, 0, 0), point, 5)
\ No newline at end of file
+        for point in point_list:
+            pygame.draw.circle(target, (255, 0, 0), point, self.POINT_RADIUS)
+
+        # Highlight the selected waypoint, whether or not simplification kept it
+        selected = self.index_of(self.selected_id) if self.selected_id is not None else None
+        if selected is not None:
+            pygame.draw.circle(target, (255, 255, 0), points[selected].tolist(), self.POINT_RADIUS + 2, 2)
@@ -0,0 +1,93 @@
+from collections import deque
+import threading
+import pygame
+
+# Posted to the pygame queue so a sleeping main loop wakes up for queued actions
+ACTION_EVENT = pygame.event.custom_type()
+
+PAN_DIRECTIONS = {
+    "pan_left": (1, 0),
+    "pan_right": (-1, 0),
+    "pan_up": (0, 1),
+    "pan_down": (0, -1),
+}
+
+ZOOM_DIRECTIONS = {
+    "zoom_in": 1,
+    "zoom_out": -1,
+}
+
+
+class ActionQueue:
+    """Actions from every input source, drained once per frame by the main loop
+
+    push() may be called from any thread. One ACTION_EVENT wakes the main
+    loop per batch: the flag saying one is pending is read and cleared
+    under the same short lock as the queue, so a push racing a drain
+    always gets its own event.
+    """
+
+    def __init__(self):
+        self.actions = deque()
+        self.lock = threading.Lock()
+        self.event_pending = False
+
+    def push(self, action):
+        """Queue an action name, ("pan", dx, dy) for a pixel pan or ("zoom", delta)"""
+        with self.lock:
+            self.actions.append(action)
+            post = not self.event_pending
+            self.event_pending = True
+        if post:
+            try:
+                pygame.event.post(pygame.event.Event(ACTION_EVENT))
+            except pygame.error:
+                # Not posted (no display yet, or the event queue is full); let the next push try
+                with self.lock:
+                    self.event_pending = False
+
+    def drain(self):
+        with self.lock:
+            drained = list(self.actions)
+            self.actions.clear()
+            self.event_pending = False
+        return drained
+
+
+class CoalescedActions:
+    """The net effect of one frame's worth of actions"""
+
+    def __init__(self):
+        self.reset_view = False
+        # Pixel pans, applied as they are
+        self.pan_x = 0
+        self.pan_y = 0
+        # Net pan direction from pan_* actions, which the camera animates
+        self.pan_direction_x = 0
+        self.pan_direction_y = 0
+        self.zoom_steps = 0
+        self.zoom_delta = 0.0
+
+
+def coalesce_actions(actions):
+    """Fold queued actions into a single change, e.g. five drag pans into one offset"""
+    result = CoalescedActions()
+    for action in actions:
+        if isinstance(action, tuple) and action[0] == "pan":
+            result.pan_x += action[1]
+            result.pan_y += action[2]
+        elif isinstance(action, tuple) and action[0] == "zoom":
+            result.zoom_delta += action[1]
+        elif action in PAN_DIRECTIONS:
+            dx, dy = PAN_DIRECTIONS[action]
+            result.pan_direction_x += dx
+            result.pan_direction_y += dy
+        elif action == "zoom_in":
+            result.zoom_steps += 1
+        elif action == "zoom_out":
+            result.zoom_steps -= 1
+        elif action == "reset_view":
+            # Anything queued before a reset no longer matters
+            result = CoalescedActions()
+            result.reset_view = True
+    return result
@@ -0,0 +1,415 @@
+import json
+import math
+import os
+import sys
+import time
+import pygame
+from input_actions import PAN_DIRECTIONS, ZOOM_DIRECTIONS
+from text_cache import render_text
+
+
+# What to do with the control when binding each analog input
+AXIS_PROMPTS = {
+    "pan_horizontal": "Push axis right",
+    "pan_vertical": "Push axis down",
+    "zoom": "Push axis towards zoom in",
+    "pan_hat": "Move hat",
+}
+
+
+class InputBackend:
+    """Base class for the input sources that feed MapViewer's action queue
+
+    Backends turn keybinds into lookup tables, poll whatever they watch in
+    handle_input() and push action names to map_viewer.action_queue.
+    Bound keys and buttons queue their action once, when first pressed;
+    after that the camera reads held pan and zoom binds each frame through
+    held_pan_direction() and held_zoom_direction(), so they act for exactly
+    as long as they are held, at a rate independent of frame rate and key
+    repeat. Joystick state (tracked from SDL events) and the binding
+    capture screen are shared.
+    """
+
+    # Set by backends that must be polled every frame; the viewer then never
+    # idles on the event queue
+    continuous = False
+
+    def __init__(self, map_viewer):
+        self.map_viewer = map_viewer
+        self.running = True
+
+        # Keybinds compiled into direct lookups; rebuilt whenever settings change
+        self.key_actions = {}
+        self.joystick_actions = {}
+        self.compile_keybinds(map_viewer.settings.settings["keybinds"])
+
+        # Joysticks are opened as SDL reports them and tracked by instance id.
+        # Button, axis and hat state comes from events, keyed by device index
+        # (event.joy), which is what bindings store.
+        self.joysticks = {}
+        # Bound key codes currently held, as backends track them
+        self.held_keys = set()
+        self.held_buttons = set()
+        self.axis_values = {}
+        self.hat_values = {}
+        self.analog_remainder = [0.0, 0.0]
+        self.last_analog_update = time.time()
+        for i in range(pygame.joystick.get_count()):
+            self.open_joystick(i)
+
+    def key_code(self, pygame_key):
+        """Translate a pygame key code into the code this backend looks keys up by"""
+        return pygame_key
+
+    def compile_keybinds(self, keybinds):
+        """Build the key and joystick button lookup tables from the keybinds"""
+        key_actions = {}
+        joystick_actions = {}
+        for action, bind in keybinds.items():
+            if bind["type"] == "keyboard":
+                code = self.key_code(bind["value"])
+                if code:
+                    key_actions[code] = action
+            elif bind["type"] == "joystick":
+                joystick_actions[(bind.get("joy_id", 0), bind["value"])] = action
+
+        # Swap in whole tables so other threads never see a half-built one
+        self.key_actions = key_actions
+        self.joystick_actions = joystick_actions
+
+    def open_joystick(self, device_index):
+        try:
+            joy = pygame.joystick.Joystick(device_index)
+            joy.init()
+            if joy.get_instance_id() not in self.joysticks:
+                self.joysticks[joy.get_instance_id()] = {
+                    "joystick": joy,
+                    "index": device_index
+                }
+        except Exception as e:
+            print(f"Error opening joystick {device_index}: {e}")
+
+    def close_joystick(self, instance_id):
+        joy_info = self.joysticks.pop(instance_id, None)
+        if joy_info is None:
+            return
+        index = joy_info["index"]
+        self.held_buttons = {held for held in self.held_buttons if held[0] != index}
+        self.axis_values = {key: value for key, value in self.axis_values.items() if key[0] != index}
+        self.hat_values = {key: value for key, value in self.hat_values.items() if key[0] != index}
+        try:
+            joy_info["joystick"].quit()
+        except Exception:
+            pass
+
+    def handle_event(self, event):
+        """Track joystick hotplug and button, axis and hat state from SDL events"""
+        if event.type == pygame.JOYDEVICEADDED:
+            self.open_joystick(event.device_index)
+        elif event.type == pygame.JOYDEVICEREMOVED:
+            self.close_joystick(event.instance_id)
+        elif event.type == pygame.JOYBUTTONDOWN:
+            self.held_buttons.add((event.joy, event.button))
+            self.push_press(self.joystick_actions.get((event.joy, event.button)))
+        elif event.type == pygame.JOYBUTTONUP:
+            self.held_buttons.discard((event.joy, event.button))
+        elif event.type == pygame.JOYAXISMOTION:
+            self.axis_values[(event.joy, event.axis)] = event.value
+        elif event.type == pygame.JOYHATMOTION:
+            self.hat_values[(event.joy, event.hat)] = event.value
+
+    def push_press(self, action):
+        """Queue the action of a key or button that was just pressed
+
+        This is one zoom step, or a one-frame nudge for a pan, so a tap
+        shorter than a frame still registers.
+        """
+        if action:
+            self.map_viewer.action_queue.push(action)
+
+    def start(self):
+        """Begin listening for input"""
+
+    def handle_input(self):
+        """Update held keys for backends that poll them, and queue actions for deflected axes"""
+        self.poll_keyboard()
+        self.handle_analog()
+
+    def held_actions(self):
+        """Actions of the keys and buttons held right now"""
+        actions = {self.key_actions.get(code) for code in self.held_keys}
+        actions.update(self.joystick_actions.get(held) for held in self.held_buttons)
+        return actions
+
+    def held_pan_direction(self):
+        """Net (dx, dy) of the pan keys and buttons held right now"""
+        dx = dy = 0
+        for action in self.held_actions():
+            if action in PAN_DIRECTIONS:
+                dx += PAN_DIRECTIONS[action][0]
+                dy += PAN_DIRECTIONS[action][1]
+        return dx, dy
+
+    def held_zoom_direction(self):
+        """+1 while only zoom in is held, -1 while only zoom out is, else 0"""
+        return sum(ZOOM_DIRECTIONS.get(action, 0) for action in self.held_actions())
+
+    def shape_axis(self, value):
+        """Apply the deadzone and response curve to a raw axis value"""
+        settings = self.map_viewer.settings.settings
+        deadzone = settings["axis_deadzone"]
+        magnitude = abs(value)
+        if magnitude <= deadzone:
+            return 0.0
+        # Rescale so output starts from zero at the deadzone edge
+        magnitude = min(1.0, (magnitude - deadzone) / (1.0 - deadzone))
+        return math.copysign(magnitude ** settings["axis_curve"], value)
+
+    def bound_axis(self, name):
+        bind = self.map_viewer.settings.settings["axis_binds"].get(name)
+        if not bind or bind["type"] != "axis":
+            return 0.0
+        value = self.shape_axis(self.axis_values.get((bind.get("joy_id", 0), bind["value"]), 0.0))
+        return -value if bind.get("invert") else value
+
+    def handle_analog(self):
+        """Turn stick and hat deflection into pan and zoom, scaled by frame time"""
+        now = time.time()
+        # Cap the step so a frame after an idle sleep doesn't jump the view
+        dt = min(now - self.last_analog_update, 0.1)
+        self.last_analog_update = now
+
+        settings = self.map_viewer.settings.settings
+        pan_x = self.bound_axis("pan_horizontal")
+        pan_y = self.bound_axis("pan_vertical")
+        hat_bind = settings["axis_binds"].get("pan_hat")
+        if hat_bind and hat_bind["type"] == "hat":
+            hat_x, hat_y = self.hat_values.get((hat_bind.get("joy_id", 0), hat_bind["value"]), (0, 0))
+            # Hats report up as +1, the opposite of stick axes
+            pan_x += hat_x
+            pan_y -= hat_y
+        zoom = self.bound_axis("zoom")
+
+        action_queue = self.map_viewer.action_queue
+        if pan_x or pan_y:
+            # Pushing right or down moves the view that way, so the map moves the other way.
+            # Whole pixels are queued and the fraction carried to the next frame.
+            speed = settings["axis_pan_speed"] * dt
+            self.analog_remainder[0] -= max(-1.0, min(1.0, pan_x)) * speed
+            self.analog_remainder[1] -= max(-1.0, min(1.0, pan_y)) * speed
+            dx = int(self.analog_remainder[0])
+            dy = int(self.analog_remainder[1])
+            self.analog_remainder[0] -= dx
+            self.analog_remainder[1] -= dy
+            if dx or dy:
+                action_queue.push(("pan", dx, dy))
+        else:
+            self.analog_remainder = [0.0, 0.0]
+
+        if zoom:
+            action_queue.push(("zoom", zoom * settings["axis_zoom_speed"] * dt))
+
+    def poll_keyboard(self):
+        """Update held_keys, for backends that read the keyboard by polling"""
+
+    def suspend(self):
+        """Stop delivering input while a binding is being captured"""
+        self.held_keys = set()
+
+    def show_binding_prompt(self, text):
+        viewer = self.map_viewer
+        prompt = render_text(text, 36, (255, 255, 255))
+        viewer.screen.fill((0, 0, 0))
+        viewer.screen.blit(prompt, prompt.get_rect(center=(viewer.screen_width // 2, viewer.screen_height // 2)))
+        pygame.display.flip()
+
+    def capture_binding(self, prompt, accept):
+        """Show prompt until accept(event) returns something other than None
+
+        Returns what accept returned, or None if capture was cancelled.
+        """
+        self.suspend()
+
+        # Give switches that were being released a moment to settle, then
+        # drop their events so only a fresh press is captured
+        self.show_binding_prompt("Getting ready...")
+        pygame.time.wait(500)
+        for event in pygame.event.get():
+            self.handle_event(event)
+
+        initial_axes = {}
+        for joy_info in self.joysticks.values():
+            joy = joy_info["joystick"]
+            for axis in range(joy.get_numaxes()):
+                initial_axes[(joy_info["index"], axis)] = joy.get_axis(axis)
+
+        binding = None
+        waiting = True
+        self.show_binding_prompt(prompt)
+        while waiting:
+            event = pygame.event.wait()
+            self.handle_event(event)
+            if event.type == pygame.QUIT:
+                pygame.event.post(event)
+                waiting = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                waiting = False
+            elif event.type == pygame.JOYAXISMOTION:
+                # Only a deliberate movement away from where the axis rested counts
+                if abs(event.value - initial_axes.get((event.joy, event.axis), 0.0)) < 0.5:
+                    continue
+                result = accept(event)
+            else:
+                result = accept(event)
+                if result is None and event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                    self.show_binding_prompt(prompt)
+                    continue
+            if waiting and result is not None:
+                binding = result
+                waiting = False
+
+        # Start listening again with the new bindings
+        self.start()
+        self.map_viewer.setup_global_input_handlers()
+        return binding
+
+    def wait_for_keybind(self, key_to_bind):
+        """Wait for a key or button press to create a new keybinding"""
+        def accept(event):
+            if event.type == pygame.KEYDOWN:
+                return {"type": "keyboard", "value": event.key}
+            if event.type == pygame.JOYBUTTONDOWN:
+                return {"type": "joystick", "joy_id": event.joy, "value": event.button}
+            return None
+
+        binding = self.capture_binding(f"Press key or button for {key_to_bind} (ESC to cancel)...", accept)
+        if binding:
+            self.map_viewer.settings.settings["keybinds"][key_to_bind] = binding
+            self.map_viewer.settings.save_settings()
+            self.compile_keybinds(self.map_viewer.settings.settings["keybinds"])
+
+    def wait_for_axis_bind(self, name):
+        """Wait for an axis (or, for pan_hat, a hat) to move and bind it; Backspace unbinds"""
+        def accept(event):
+            if event.type == pygame.KEYDOWN and event.key in (pygame.K_BACKSPACE, pygame.K_DELETE):
+                return {}
+            if name == "pan_hat":
+                if event.type == pygame.JOYHATMOTION and event.value != (0, 0):
+                    return {"type": "hat", "joy_id": event.joy, "value": event.hat}
+            elif event.type == pygame.JOYAXISMOTION:
+                # Bound the way it was pushed, so the prompted direction reads as positive
+                return {"type": "axis", "joy_id": event.joy, "value": event.axis, "invert": event.value < 0}
+            return None
+
+        binding = self.capture_binding(
+            f"{AXIS_PROMPTS[name]} for {name} (Backspace to unbind, ESC to cancel)...", accept)
+        if binding is not None:
+            self.map_viewer.settings.settings["axis_binds"][name] = binding or None
+            self.map_viewer.settings.save_settings()
+
+    def stop(self):
+        """Stop listening and close joysticks"""
+        for instance_id in list(self.joysticks):
+            self.close_joystick(instance_id)
+        self.held_keys = set()
+        self.held_buttons.clear()
+        self.axis_values.clear()
+        self.hat_values.clear()
+
+
+class PygameInputBackend(InputBackend):
+    """Portable backend that reads the keyboard through pygame
+
+    Keys only register while the viewer window has focus. Which are held
+    comes from KEYDOWN and KEYUP events.
+    """
+
+    def handle_event(self, event):
+        super().handle_event(event)
+        if event.type == pygame.KEYDOWN:
+            action = self.key_actions.get(event.key)
+            if action:
+                if event.key not in self.held_keys:
+                    self.held_keys.add(event.key)
+                    self.push_press(action)
+        elif event.type == pygame.KEYUP:
+            self.held_keys.discard(event.key)
+        elif event.type == pygame.WINDOWFOCUSLOST:
+            # Keys released while another window has focus send no KEYUP here
+            self.held_keys.clear()
+
+
+class ScriptedInputBackend(InputBackend):
+    """Replays a fixed list of actions, for headless runs and profiling
+
+    The script is a list of [frame, action] pairs; an action of "quit"
+    closes the viewer. With repeat set, the script loops forever. Steps are
+    timed in frames, so the viewer redraws continuously while it plays.
+    """
+
+    continuous = True
+
+    DEFAULT_SCRIPT = (
+        [[frame, "pan_left"] for frame in range(0, 60)] +
+        [[frame, "zoom_in"] for frame in range(60, 65)] +
+        [[frame, "pan_down"] for frame in range(65, 125)] +
+        [[frame, "zoom_out"] for frame in range(125, 135)] +
+        [[frame, "pan_right"] for frame in range(135, 195)] +
+        [[200, "reset_view"]] +
+        [[230, "quit"]]
+    )
+
+    def __init__(self, map_viewer, script=None, repeat=False):
+        self.script = sorted(script if script is not None else self.DEFAULT_SCRIPT, key=lambda step: step[0])
+        self.repeat = repeat
+        self.frame = 0
+        self.position = 0
+        super().__init__(map_viewer)
+
+    @classmethod
+    def load_script(cls, path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def handle_input(self):
+        if self.repeat and self.position >= len(self.script) and self.script:
+            self.frame = 0
+            self.position = 0
+
+        while self.position < len(self.script) and self.script[self.position][0] <= self.frame:
+            action = self.script[self.position][1]
+            if action == "quit":
+                pygame.event.post(pygame.event.Event(pygame.QUIT))
+            else:
+                self.map_viewer.action_queue.push(action)
+            self.position += 1
+        self.frame += 1
+
+    def wait_for_keybind(self, key_to_bind):
+        print(f"Scripted input can't capture a keybind for {key_to_bind}")
+
+    def wait_for_axis_bind(self, name):
+        print(f"Scripted input can't capture an axis for {name}")
+
+
+def create_input_backend(map_viewer, name="auto"):
+    """Create the input backend named in settings
+
+    "auto" uses the Windows low-level hook on Windows and pygame elsewhere.
+    MAPVIEWER_INPUT_BACKEND overrides the setting, e.g. for headless profiling.
+    """
+    name = os.environ.get("MAPVIEWER_INPUT_BACKEND", name)
+    if name == "auto":
+        name = "windows" if sys.platform == "win32" else "pygame"
+
+    if name == "windows":
+        # Only importable on Windows, so load it on demand
+        from windows_input import WindowsInputHandler
+        return WindowsInputHandler(map_viewer)
+    if name == "pygame":
+        return PygameInputBackend(map_viewer)
+    if name == "scripted":
+        settings = map_viewer.settings.settings
+        script = ScriptedInputBackend.load_script(settings["input_script"]) if settings["input_script"] else None
+        return ScriptedInputBackend(map_viewer, script, repeat=settings["input_script_repeat"])
+    raise ValueError(f"Unknown input backend: {name}")
@@ -1,20 +1,46 @@
+import time
+
+# Startup is timed from here, so the imports below are included
+STARTUP_TIME = time.perf_counter()
+
 import pygame
 import math
-import requests
-from io import BytesIO
-from PIL import Image
-from bs4 import BeautifulSoup
-import time
 from settings import Settings
 from ui_elements import Button, Dropdown
-import keyboard
-from windows_input import WindowsInputHandler
-import win32con
+from input_backend import create_input_backend
+from input_actions import ActionQueue, coalesce_actions
 from chart_manager import ChartManager
+from text_cache import render_text
+from map_renderer import MapRenderer
+from scale_worker import ScaleWorker
+from viewport import Viewport
+from camera import Camera
+from map_loader import MapLoader
+from map_cache import MapImageCache, PixelCache, native_pixel_format
+
+
+class StartupTimer:
+    """Times the phases of startup and prints them once the first frame is up"""
+
+    def __init__(self, start_time):
+        self.start_time = start_time
+        self.last_time = start_time
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last_time))
+        self.last_time = now
+
+    def report(self):
+        phases = ", ".join(f"{phase} {duration * 1000:.0f} ms" for phase, duration in self.phases)
+        print(f"Startup: {phases} (total {(self.last_time - self.start_time) * 1000:.0f} ms)")
 
 
 class MapViewer:
     def __init__(self):
+        self.startup = StartupTimer(STARTUP_TIME)
+        self.startup.mark("imports")
         self.settings = Settings()
         pygame.init()
         pygame.font.init()
@@ -25,23 +51,34 @@ class MapViewer:
         self.screen_height = self.settings.settings["resolution"]["height"]
         self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
         pygame.display.set_caption("Combat Box Map Viewer by JaggedFel")
+        self.startup.mark("window")
+
+        # Actions from every input source are queued here and applied once per frame
+        self.action_queue = ActionQueue()
 
         # Initialize input handler
-        self.input_handler = WindowsInputHandler(self)
+        self.input_handler = create_input_backend(self, self.settings.settings["input_backend"])
         self.setup_global_input_handlers()
         self.input_handler.start()
+        self.startup.mark("input")
 
         # Initialize charting tools
         self.chart_manager = ChartManager()
 
         # View parameters
-        self.zoom = 1.0
-        self.x_offset = 0
-        self.y_offset = 0
-        self.pan_speed = 20
         self.zoom_speed = 0.1
         self.min_zoom = 0.2
         self.max_zoom = 1.5
+        self.viewport = Viewport(
+            (800, 600), (self.screen_width, self.screen_height), self.min_zoom, self.max_zoom)
+        # Animates pan and zoom in real time on top of the viewport
+        self.camera = Camera(
+            self.viewport,
+            max_speed=self.settings.settings["camera_pan_speed"],
+            acceleration=self.settings.settings["camera_acceleration"],
+            zoom_time=self.settings.settings["camera_zoom_time"],
+            zoom_speed=self.settings.settings["camera_zoom_speed"]
+        )
 
         # Mouse control variables
         self.dragging = False
@@ -50,8 +87,39 @@ class MapViewer:
 
         # Map tracking
         self.current_map_url = None
-        self.check_interval = 30
-        self.last_check_time = 0
+        # True while a reduced-resolution preview stands in for the current map
+        self.showing_preview = False
+        # The map and view from last session; the view is put back once that map shows
+        restore_url = None
+        self.restore_view = None
+        if self.settings.settings["restore_last_map"] and self.settings.settings["last_map_url"]:
+            restore_url = self.settings.settings["last_map_url"]
+            self.restore_view = (restore_url, self.settings.settings["last_view"])
+        # Maps big enough to be tiled are always memory-mapped from the pixel
+        # cache; use_pixel_cache extends that to every map
+        pixel_cache = PixelCache(
+            self.settings.settings["map_cache_dir"],
+            self.settings.settings["pixel_cache_mb"] * 1024 * 1024
+        )
+        self.map_loader = MapLoader(
+            source_url=self.settings.settings["map_source_url"],
+            check_interval=self.settings.settings["map_check_interval"],
+            timeout=self.settings.settings["network_timeout"],
+            min_scale=self.min_zoom,
+            map_cache=MapImageCache(
+                self.settings.settings["map_cache_dir"],
+                self.settings.settings["map_cache_mb"] * 1024 * 1024
+            ),
+            pixel_cache=pixel_cache,
+            cache_all_pixels=self.settings.settings["use_pixel_cache"],
+            pixel_format=native_pixel_format(self.screen),
+            display_format=pygame.Surface((1, 1), 0, self.screen),
+            tile_threshold=self.settings.settings["tile_threshold_mb"] * 1024 * 1024,
+            tile_size=self.settings.settings["tile_size"],
+            tile_cache_bytes=self.settings.settings["tile_cache_mb"] * 1024 * 1024,
+            preview_scale=self.settings.settings["map_preview_scale"],
+            restore_url=restore_url
+        )
 
         # Resolution options
         self.resolution_options = [
@@ -67,6 +135,8 @@ class MapViewer:
         self.settings_button = Button(10, 40, 100, 30, "Settings")
         self.refresh_button = Button(120, 40, 100, 30, "Refresh")
         self.show_settings = False
+        # Bumped whenever a binding changes, so the settings menu is redrawn
+        self.settings_revision = 0
         self.chart_button = Button(230, 40, 100, 30, "Chart")
 
         self.resolution_dropdown = Dropdown(
@@ -84,76 +154,24 @@ class MapViewer:
         except ValueError:
             self.resolution_dropdown.selected_index = 0
 
+        # Map drawing, with cached scaled surfaces and viewport cropping.
+        # Full-size layers are scaled on one worker thread and, once the view
+        # is still, a smoothscaled frame is made on another.
+        self.map_compositor = ScaleWorker("MapCompositor") if self.settings.settings["background_scaling"] else None
+        self.map_refiner = ScaleWorker("MapRefiner") if self.settings.settings["smooth_when_idle"] else None
+        self.map_renderer = MapRenderer(
+            min_scale=self.min_zoom, refiner=self.map_refiner, compositor=self.map_compositor)
+
         # Create initial placeholder
         self.create_placeholder_surface()
+        self.startup.mark("setup")
 
     def handle_input(self):
         self.input_handler.handle_input()
 
-    def cleanup(self):
-        self.input_handler.cleanup()
-        pygame.quit()
-
-    def setup_global_hotkeys(self):
-        """Setup global hotkeys using the keyboard library"""
-        keybinds = self.settings.settings["keybinds"]
-
-        # Clear any existing hotkeys
-        keyboard.unhook_all()
-
-        # Register new hotkeys
-        for action, bind in keybinds.items():
-            if bind["type"] == "keyboard":
-                key_name = pygame.key.name(bind["value"])
-                try:
-                    keyboard.on_press_key(key_name,
-                                          lambda e, a=action: self.handle_action(a),
-                                          suppress=False)
-                except Exception as e:
-                    print(f"Failed to bind key {key_name} for action {action}: {e}")
-
     def setup_global_input_handlers(self):
-        """Set up handlers for all bound keys"""
-        keybinds = self.settings.settings["keybinds"]
-
-        for action, bind in keybinds.items():
-            if bind["type"] == "keyboard":
-                vk_code = self.pygame_to_vk(bind["value"])
-                if vk_code:
-                    self.input_handler.register_key_handler(
-                        vk_code,
-                        lambda a=action: self.handle_action(a)
-                    )
-
-    def pygame_to_vk(self, pygame_key):
-        """Convert pygame key code to Windows virtual key code"""
-        key_mapping = {
-            pygame.K_LEFT: win32con.VK_LEFT,
-            pygame.K_RIGHT: win32con.VK_RIGHT,
-            pygame.K_UP: win32con.VK_UP,
-            pygame.K_DOWN: win32con.VK_DOWN,
-            pygame.K_PLUS: win32con.VK_ADD,
-            pygame.K_KP_PLUS: win32con.VK_ADD,
-            pygame.K_MINUS: win32con.VK_SUBTRACT,
-            pygame.K_KP_MINUS: win32con.VK_SUBTRACT,
-            pygame.K_r: 0x52,  # ASCII code for 'R'
-            pygame.K_ESCAPE: win32con.VK_ESCAPE
-        }
-        return key_mapping.get(pygame_key)
-
-    def update_joysticks(self):
-        """Update the list of connected joysticks"""
-        try:
-            for i in range(pygame.joystick.get_count()):
-                if i not in self.joysticks:
-                    joy = pygame.joystick.Joystick(i)
-                    joy.init()
-                    self.joysticks[i] = {
-                        "joystick": joy,
-                        "num_buttons": joy.get_numbuttons()
-                    }
-        except:
-            pass  # Silently fail if there's an error updating joysticks
+        """Recompile the input handler's lookup tables from the current keybinds"""
+        self.input_handler.compile_keybinds(self.settings.settings["keybinds"])
 
     def create_settings_buttons(self):
         buttons = []
@@ -179,8 +197,7 @@ class MapViewer:
         self.screen.blit(overlay, (0, 0))
 
         # Draw settings title
-        font = pygame.font.Font(None, 48)
-        title = font.render("Settings", True, (255, 255, 255))
+        title = render_text("Settings", 48, (255, 255, 255))
         title_rect = title.get_rect(center=(self.screen_width // 2, 100))
         self.screen.blit(title, title_rect)
 
@@ -189,29 +206,37 @@ class MapViewer:
         close_button.draw(self.screen)
 
         # Draw resolution label
-        font = pygame.font.Font(None, 24)
-        text = font.render("Resolution:", True, (255, 255, 255))
+        text = render_text("Resolution:", 24, (255, 255, 255))
         self.screen.blit(text, (self.screen_width // 2 - 200, 205))
 
-        # Draw keybind buttons
-        y_pos = 300
-        for key, bind in self.settings.settings["keybinds"].items():
-            text = font.render(f"{key}:", True, (255, 255, 255))
-            self.screen.blit(text, (self.screen_width // 2 - 200, y_pos + 5))
+        # Draw keybind and analog bind buttons
+        for kind, name, button_rect in self.bind_button_rects():
+            text = render_text(f"{name}:", 24, (255, 255, 255))
+            self.screen.blit(text, (button_rect.x - 200, button_rect.y + 5))
 
-            if bind["type"] == "keyboard":
-                value_text = pygame.key.name(bind["value"])
+            if kind == "key":
+                bind = self.settings.settings["keybinds"][name]
+                if bind["type"] == "keyboard":
+                    value_text = pygame.key.name(bind["value"])
+                else:
+                    joy_id = bind.get("joy_id", 0)
+                    value_text = f"Joy {joy_id} Button {bind['value']}"
             else:
-                joy_id = bind.get("joy_id", 0)
-                value_text = f"Joy {joy_id} Button {bind['value']}"
+                bind = self.settings.settings["axis_binds"][name]
+                if not bind:
+                    value_text = "Unbound"
+                elif bind["type"] == "hat":
+                    value_text = f"Joy {bind.get('joy_id', 0)} Hat {bind['value']}"
+                else:
+                    invert = " (inv)" if bind.get("invert") else ""
+                    value_text = f"Joy {bind.get('joy_id', 0)} Axis {bind['value']}{invert}"
 
-            button = Button(self.screen_width // 2, y_pos, 150, 30, value_text)
+            button = Button(button_rect.x, button_rect.y, button_rect.width, button_rect.height, value_text)
             button.draw(self.screen)
-            y_pos += 40
 
         # Draw scroll wheel toggle last
         y_pos = 250
-        text = font.render("Use Scroll Wheel:", True, (255, 255, 255))
+        text = render_text("Use Scroll Wheel:", 24, (255, 255, 255))
         self.screen.blit(text, (self.screen_width // 2 - 200, y_pos + 5))
         toggle_text = "ON" if self.settings.settings["use_scroll_wheel"] else "OFF"
         toggle_button = Button(self.screen_width // 2, y_pos, 150, 30, toggle_text)
@@ -220,6 +245,16 @@ class MapViewer:
         # Draw resolution dropdown last to ensure it appears on top
         self.resolution_dropdown.draw(self.screen)
 
+    def bind_button_rects(self):
+        """Lay out the bind buttons in two columns centred on the screen, keybinds
+        on the left and analog binds on the right, so they fit on screen at 800x600"""
+        rects = []
+        for column, (kind, binds) in enumerate((("key", "keybinds"), ("axis", "axis_binds"))):
+            x_pos = self.screen_width // 2 - 180 + column * 400
+            for row, name in enumerate(self.settings.settings[binds]):
+                rects.append((kind, name, pygame.Rect(x_pos, 300 + row * 40, 150, 30)))
+        return rects
+
     def toggle_resolution(self):
         self.current_resolution_index = (self.current_resolution_index + 1) % len(self.resolution_options)
         width, height = map(int, self.resolution_options[self.current_resolution_index].split('x'))
@@ -247,9 +282,8 @@ class MapViewer:
             self.screen = pygame.display.set_mode((width, height))
 
             # Reset view parameters
-            self.zoom = 1.0
-            self.x_offset = 0
-            self.y_offset = 0
+            self.viewport.set_screen_size((width, height))
+            self.camera.reset()
 
             # Recreate UI elements with new positions
             self.settings_button = Button(10, 40, 100, 30, "Settings")
@@ -278,151 +312,58 @@ class MapViewer:
                 self.settings.save_settings()
                 return True
 
-            # Handle keybind buttons
-            y_pos = 300
-            for key in self.settings.settings["keybinds"].keys():
-                button_rect = pygame.Rect(self.screen_width // 2, y_pos, 150, 30)
+            # Handle keybind and analog bind buttons
+            for kind, name, button_rect in self.bind_button_rects():
                 if button_rect.collidepoint(mouse_pos):
-                    self.input_handler.wait_for_keybind(key)
+                    if kind == "key":
+                        self.input_handler.wait_for_keybind(name)
+                    else:
+                        self.input_handler.wait_for_axis_bind(name)
+                    self.settings_revision += 1
                     return True
-                y_pos += 40
 
         return False
 
-    def wait_for_keybind(self, key_to_bind):
-        waiting = True
-        font = pygame.font.Font(None, 36)
-        prompt = font.render(f"Press key or button for {key_to_bind} (ESC to cancel)...", True, (255, 255, 255))
-        prompt_rect = prompt.get_rect(center=(self.screen_width // 2, self.screen_height // 2))
-
-        # Temporarily unhook all keys while binding
-        keyboard.unhook_all()
-
-        while waiting:
-            self.screen.fill((0, 0, 0))
-            self.screen.blit(prompt, prompt_rect)
-            pygame.display.flip()
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    return
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        waiting = False
-                    else:
-                        self.settings.settings["keybinds"][key_to_bind] = {
-                            "type": "keyboard",
-                            "value": event.key
-                        }
-                        self.settings.save_settings()
-                        waiting = False
-                elif event.type == pygame.JOYBUTTONDOWN:
-                    self.settings.settings["keybinds"][key_to_bind] = {
-                        "type": "joystick",
-                        "joy_id": event.joy,
-                        "value": event.button
-                    }
-                    self.settings.save_settings()
-                    waiting = False
-
-        # Restore global hotkeys
-        self.input_handler.setup_global_hotkeys()
-
     def refresh_map(self):
-        self.check_for_new_map(force=True)
+        self.map_loader.refresh()
+
     def create_placeholder_surface(self):
         self.original_surface = pygame.Surface((800, 600))
         self.original_surface.fill((50, 50, 50))
-        font = pygame.font.Font(None, 36)
-        text = font.render("Checking for map...", True, (255, 255, 255))
+        text = render_text("Checking for map...", 36, (255, 255, 255))
         text_rect = text.get_rect(center=(400, 300))
         self.original_surface.blit(text, text_rect)
+        self.map_renderer.set_map(self.original_surface)
+        self.viewport.set_map_size(self.original_surface.get_size())
+        self.showing_preview = False
 
-    def get_current_map_url(self):
-        try:
-            response = requests.get("https://combatbox.net/en/")
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            current_map_div = soup.find('div', class_='dominant_coal')
-            if current_map_div:
-                map_link = current_map_div.find('a', href=lambda x: x and 'missionmapimages' in x)
-                if map_link:
-                    return map_link['href']
-            return None
-        except Exception as e:
-            print(f"Error fetching map URL: {e}")
-            return None
-
-    def load_new_map(self, map_url):
-        try:
-            response = requests.get(map_url)
-            response.raise_for_status()
-            image_data = BytesIO(response.content)
-            self.original_image = Image.open(image_data)
-            self.original_surface = pygame.image.fromstring(
-                self.original_image.tobytes(), self.original_image.size, self.original_image.mode)
-            self.zoom = 1.0
-            self.x_offset = 0
-            self.y_offset = 0
-            print(f"Successfully loaded new map")
-        except Exception as e:
-            print(f"Error loading map: {e}")
+    def load_new_map(self, result):
+        """Install a map decoded by the background loader"""
+        if result.surface is None:
             self.create_placeholder_surface()
-
-    def constrain_position(self):
-        scaled_width = int(self.original_surface.get_width() * self.zoom)
-        scaled_height = int(self.original_surface.get_height() * self.zoom)
-
-        min_x_offset = -(scaled_width - self.screen_width) // 2
-        max_x_offset = (scaled_width - self.screen_width) // 2
-        min_y_offset = -(scaled_height - self.screen_height) // 2
-        max_y_offset = (scaled_height - self.screen_height) // 2
-
-        if scaled_width < self.screen_width:
-            self.x_offset = 0
-        else:
-            self.x_offset = max(min_x_offset, min(self.x_offset, max_x_offset))
-
-        if scaled_height < self.screen_height:
-            self.y_offset = 0
-        else:
-            self.y_offset = max(min_y_offset, min(self.y_offset, max_y_offset))
-
-    def handle_zoom(self, zoom_in):
-        # Store old dimensions
-        old_scaled_width = int(self.original_surface.get_width() * self.zoom)
-        old_scaled_height = int(self.original_surface.get_height() * self.zoom)
-
-        # Calculate map center relative to view
-        map_center_x = old_scaled_width // 2
-        map_center_y = old_scaled_height // 2
-
-        # Apply zoom
-        old_zoom = self.zoom
-        if zoom_in:
-            self.zoom = min(self.max_zoom, self.zoom + self.wheel_zoom_speed)
+            return
+        # The full image replacing its own preview keeps wherever the user has moved to
+        replaces_preview = self.showing_preview and result.map_url == self.current_map_url
+        self.showing_preview = result.preview
+
+        self.original_surface = result.surface
+        self.map_renderer.set_map(self.original_surface, result.pyramid, result.tiled)
+        # A preview is drawn stretched to the full map's size, so zoom and chart
+        # coordinates don't change when the full image arrives
+        self.viewport.set_map_size(result.map_size)
+        if replaces_preview:
+            return
+        if self.restore_view and self.restore_view[0] == result.map_url and self.restore_view[1]:
+            self.camera.jump_to(*self.restore_view[1])
         else:
-            self.zoom = max(self.min_zoom, self.zoom - self.wheel_zoom_speed)
-
-        # Calculate new dimensions
-        new_scaled_width = int(self.original_surface.get_width() * self.zoom)
-        new_scaled_height = int(self.original_surface.get_height() * self.zoom)
-
-        # Adjust offset to maintain center point
-        scale_factor = self.zoom / old_zoom
-        self.x_offset = int(self.x_offset * scale_factor)
-        self.y_offset = int(self.y_offset * scale_factor)
-
-        self.constrain_position()
+            self.camera.reset()
+        self.restore_view = None
 
     def handle_mouse_input(self, event):
         mouse_pos = pygame.mouse.get_pos()
         if self.chart_manager.chart_mode:
-            scaled_width = int(self.original_surface.get_width() * self.zoom)
-            scaled_height = int(self.original_surface.get_height() * self.zoom)
-            map_x = (mouse_pos[0] - self.screen_width // 2 + scaled_width // 2 - self.x_offset) / self.zoom
-            map_y = (mouse_pos[1] - self.screen_height // 2 + scaled_height // 2 - self.y_offset) / self.zoom
-            if self.chart_manager.handle_click(event, mouse_pos, (map_x, map_y)):
+            map_pos = self.viewport.screen_to_map_point(mouse_pos)
+            if self.chart_manager.handle_click(event, mouse_pos, map_pos, self.viewport.zoom):
                 self.dragging = False
                 self.last_mouse_pos = None
                 return
@@ -433,9 +374,9 @@ class MapViewer:
                 self.dragging = True
                 self.last_mouse_pos = event.pos
             elif event.button == 4:  # Mouse wheel up
-                self.handle_zoom(True)
+                self.action_queue.push("zoom_in")
             elif event.button == 5:  # Mouse wheel down
-                self.handle_zoom(False)
+                self.action_queue.push("zoom_out")
 
         elif event.type == pygame.MOUSEBUTTONUP:
             if event.button == 1:  # Left mouse button
@@ -445,64 +386,45 @@ class MapViewer:
             if self.dragging and self.last_mouse_pos and not self.chart_manager.chart_mode:
                 dx = event.pos[0] - self.last_mouse_pos[0]
                 dy = event.pos[1] - self.last_mouse_pos[1]
-                self.x_offset += dx
-                self.y_offset += dy
                 self.last_mouse_pos = event.pos
-                self.constrain_position()
-
-    def check_for_new_map(self, force=False):
-        current_time = time.time()
-        if force or current_time - self.last_check_time >= self.check_interval:
-            self.last_check_time = current_time
-            new_map_url = self.get_current_map_url()
-
-            if new_map_url and (force or new_map_url != self.current_map_url):
-                print(f"Loading new map: {new_map_url}")
-                self.load_new_map(new_map_url)
-                self.current_map_url = new_map_url
-
-    def handle_action(self, action):
-        """Handle various actions based on input"""
-        if not self.show_settings:  # Only handle actions when not in settings
-            if action == "pan_left":
-                self.x_offset += self.pan_speed
-            elif action == "pan_right":
-                self.x_offset -= self.pan_speed
-            elif action == "pan_up":
-                self.y_offset += self.pan_speed
-            elif action == "pan_down":
-                self.y_offset -= self.pan_speed
-            elif action == "zoom_in":
-                self.handle_zoom(True)
-            elif action == "zoom_out":
-                self.handle_zoom(False)
-            elif action == "reset_view":
-                self.zoom = 1.0
-                self.x_offset = 0
-                self.y_offset = 0
-
-            self.constrain_position()
+                self.action_queue.push(("pan", dx, dy))
+
+    def check_for_new_map(self):
+        """Pick up any map the background loader has finished"""
+        for result in self.map_loader.poll():
+            self.load_new_map(result)
+            self.current_map_url = result.map_url
+
+    def process_actions(self):
+        """Apply everything queued since the last frame as a single view change"""
+        actions = self.action_queue.drain()
+        if not actions or self.show_settings:  # Only handle actions when not in settings
+            return
+
+        combined = coalesce_actions(actions)
+        if combined.reset_view:
+            self.camera.reset()
+        if combined.zoom_steps:
+            self.camera.zoom_by(combined.zoom_steps * self.wheel_zoom_speed)
+        if combined.zoom_delta:
+            self.camera.zoom_now(combined.zoom_delta)
+        if combined.pan_direction_x or combined.pan_direction_y:
+            self.camera.push(combined.pan_direction_x, combined.pan_direction_y)
+        if combined.pan_x or combined.pan_y:
+            self.viewport.pan(combined.pan_x, combined.pan_y)
+        self.viewport.constrain()
 
     def render(self):
         self.screen.fill((0, 0, 0))
 
         # Draw map
-        scaled_width = int(self.original_surface.get_width() * self.zoom)
-        scaled_height = int(self.original_surface.get_height() * self.zoom)
-
-        scaled_surface = pygame.transform.scale(
-            self.original_surface, (scaled_width, scaled_height))
-
-        display_x = self.screen_width // 2 - scaled_width // 2 + self.x_offset
-        display_y = self.screen_height // 2 - scaled_height // 2 + self.y_offset
-
-        self.screen.blit(scaled_surface, (display_x, display_y))
+        # While the camera animates, draw cheap frames; the settled frame is full quality
+        self.map_renderer.draw(self.screen, self.viewport, fast=self.camera.moving)
 
         # Draw UI elements
         if self.current_map_url:
-            font = pygame.font.Font(None, 24)
             map_name = self.current_map_url.split('/')[-1].replace('.jpg', '')
-            text = font.render(f"Map: {map_name} | Zoom: {self.zoom:.1f}x", True, (255, 255, 255))
+            text = render_text(f"Map: {map_name} | Zoom: {self.viewport.zoom:.1f}x", 24, (255, 255, 255))
             self.screen.blit(text, (10, 10))
 
         self.settings_button.draw(self.screen)
@@ -514,46 +436,72 @@ class MapViewer:
             self.draw_settings_menu()
 
         if self.chart_manager.chart_mode:
-            def transform_point(p):
-                return (int(self.screen_width // 2 - scaled_width // 2 + self.x_offset + p[0] * self.zoom),
-                        int(self.screen_height // 2 - scaled_height // 2 + self.y_offset + p[1] * self.zoom))
-
-            self.chart_manager.draw(self.screen, transform_point)
+            self.chart_manager.draw(self.screen, self.viewport, moving=self.camera.moving)
 
         pygame.display.flip()
 
-    def pygame_to_keyboard_key(self, pygame_key):
-        """Convert pygame key code to keyboard library key name"""
-        key_mapping = {
-            pygame.K_LEFT: 'left',
-            pygame.K_RIGHT: 'right',
-            pygame.K_UP: 'up',
-            pygame.K_DOWN: 'down',
-            pygame.K_PLUS: '+',
-            pygame.K_KP_PLUS: '+',
-            pygame.K_MINUS: '-',
-            pygame.K_KP_MINUS: '-',
-            pygame.K_r: 'r',
-            pygame.K_ESCAPE: 'esc'
-        }
-        return key_mapping.get(pygame_key)
+    def view_state(self):
+        """Everything that affects what a frame looks like"""
+        state = (
+            self.viewport.state, self.camera.moving,
+            self.screen_width, self.screen_height,
+            self.map_renderer.map_id, self.map_renderer.refined_key, self.map_renderer.tiles_built,
+            self.current_map_url,
+            self.show_settings,
+            self.chart_manager.chart_mode, self.chart_manager.revision, self.chart_manager.selected_id,
+            self.settings_button.is_hovered, self.refresh_button.is_hovered,
+            self.chart_button.is_hovered
+        )
+        if self.show_settings:
+            state += (
+                self.settings.settings["use_scroll_wheel"],
+                self.settings_revision,
+                self.resolution_dropdown.open,
+                self.resolution_dropdown.hover_index,
+                self.resolution_dropdown.selected_index
+            )
+        return state
+
+    def next_events(self, idle):
+        """Return pending events, blocking for up to one idle frame when nothing is happening"""
+        if not idle:
+            return pygame.event.get()
+        event = pygame.event.wait(int(1000 / self.settings.settings["idle_fps"]))
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event] + pygame.event.get()
 
     def run(self):
         running = True
         clock = pygame.time.Clock()
-
-        # Initial map check
-        self.check_for_new_map()
-        self.last_joystick_update = time.time()
+        redraw_on_demand = self.settings.settings["redraw_on_demand"] and not self.input_handler.continuous
+        active_fps = self.settings.settings["active_fps"]
+        idle_after = self.settings.settings["idle_after"]
+        refine_delay = self.settings.settings["refine_delay"]
+
+        # Restoring the last map and the first check both happen on the loader thread
+        self.map_loader.start()
+        for worker in (self.map_compositor, self.map_refiner):
+            if worker:
+                worker.start()
+
+        # Frames are only drawn when the view changes; after idle_after seconds
+        # without a change the loop sleeps on the event queue instead of spinning
+        last_frame_state = None
+        last_change_time = time.time()
+        last_update_time = time.time()
+        needs_redraw = True
 
         while running:
-            # Update joysticks every 10 seconds instead of every frame
             current_time = time.time()
-            if current_time - self.last_joystick_update > 10:
-                self.update_joysticks()
-                self.last_joystick_update = current_time
+            idle = redraw_on_demand and current_time - last_change_time > idle_after
+            for event in self.next_events(idle):
+                if event.type in (pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED, pygame.VIDEOEXPOSE):
+                    needs_redraw = True
+
+                # Joystick hotplug, buttons and axes arrive as events
+                self.input_handler.handle_event(event)
 
-            for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
                 elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE and self.show_settings:
@@ -576,14 +524,60 @@ class MapViewer:
             if not self.show_settings:
                 self.check_for_new_map()
                 self.handle_input()
-
-            self.render()
-            clock.tick(60)  # Limit to 60 FPS
+                self.camera.hold(*self.input_handler.held_pan_direction())
+                self.camera.hold_zoom(self.input_handler.held_zoom_direction())
+            else:
+                self.camera.hold(0, 0)
+                self.camera.hold_zoom(0)
+            self.process_actions()
+
+            # Advance the camera by real elapsed time, capped so waking from
+            # an idle wait doesn't jump the view
+            now = time.time()
+            self.camera.update(min(now - last_update_time, 0.1))
+            last_update_time = now
+
+            self.map_renderer.poll()
+
+            frame_state = self.view_state()
+            if frame_state != last_frame_state:
+                last_change_time = time.time()
+            elif now - last_change_time >= refine_delay and not self.camera.moving:
+                # The view has been still for a moment; smoothscale it in the background
+                self.map_renderer.refine(self.screen.get_size(), self.viewport)
+            if needs_redraw or not redraw_on_demand or frame_state != last_frame_state:
+                self.render()
+                last_frame_state = frame_state
+                needs_redraw = False
+                if self.startup:
+                    self.startup.mark("first frame")
+                    self.startup.report()
+                    self.startup = None
+
+            clock.tick(active_fps)
 
         pygame.quit()
 
+    def save_last_view(self):
+        """Remember the map and view so the next start can show them straight away"""
+        if not self.current_map_url or not hasattr(self, 'viewport'):
+            return
+        self.settings.settings["last_map_url"] = self.current_map_url
+        self.settings.settings["last_view"] = list(self.viewport.state)
+        try:
+            self.settings.save_settings()
+        except Exception as e:
+            print(f"Error saving last view: {e}")
+
     def cleanup(self):
         """Clean up resources"""
+        if hasattr(self, 'current_map_url'):
+            self.save_last_view()
+        if hasattr(self, 'map_loader'):
+            self.map_loader.stop()
+        for worker in (getattr(self, 'map_compositor', None), getattr(self, 'map_refiner', None)):
+            if worker:
+                worker.stop()
         if hasattr(self, 'input_handler'):
             self.input_handler.stop()
         pygame.quit()
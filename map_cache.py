@@ -0,0 +1,214 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+import pygame
+
+
+class MapImageCache:
+    """Content-addressed on-disk cache of downloaded map images
+
+    Images are stored under the SHA-256 of their content and looked up by
+    map URL. The least recently used files are evicted once the cache
+    grows past max_bytes. Hits only mark the index dirty; it is written
+    when an image is stored or on flush().
+    """
+
+    def __init__(self, cache_dir="map_cache", max_bytes=500 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self.lock = threading.Lock()
+        self.index = self.load_index()
+        self.dirty = False
+
+    def load_index(self):
+        try:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'r') as f:
+                    index = json.load(f)
+                if "urls" in index and "files" in index:
+                    return index
+        except Exception as e:
+            print(f"Error reading map cache index: {e}")
+        return {"urls": {}, "files": {}}
+
+    def save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_file = self.index_file + ".tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(temp_file, self.index_file)
+        self.dirty = False
+
+    def flush(self):
+        """Write out last-used times recorded since the index was last saved"""
+        with self.lock:
+            if not self.dirty:
+                return
+            try:
+                self.save_index()
+            except OSError as e:
+                print(f"Error writing map cache index: {e}")
+
+    def content_hash(self, url):
+        """Return the hash of the image cached for url, if any"""
+        with self.lock:
+            return self.index["urls"].get(url)
+
+    def path_for(self, content_hash):
+        return os.path.join(self.cache_dir, content_hash + ".img")
+
+    def get(self, url):
+        """Return the cached image for url, or None if it isn't cached"""
+        with self.lock:
+            content_hash = self.index["urls"].get(url)
+            if content_hash is None or content_hash not in self.index["files"]:
+                return None
+            try:
+                with open(self.path_for(content_hash), 'rb') as f:
+                    content = f.read()
+            except OSError:
+                self.forget(content_hash)
+                return None
+            if hashlib.sha256(content).hexdigest() != content_hash:
+                self.forget(content_hash)
+                return None
+
+            self.index["files"][content_hash]["last_used"] = time.time()
+            self.dirty = True
+            return content
+
+    def touch(self, url):
+        """Mark the image cached for url as just used, without reading it"""
+        with self.lock:
+            content_hash = self.index["urls"].get(url)
+            if content_hash in self.index["files"]:
+                self.index["files"][content_hash]["last_used"] = time.time()
+                self.dirty = True
+
+    def put(self, url, content):
+        """Store an image for url and return its content hash"""
+        content_hash = hashlib.sha256(content).hexdigest()
+        with self.lock:
+            if content_hash not in self.index["files"]:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                temp_file = self.path_for(content_hash) + ".tmp"
+                with open(temp_file, 'wb') as f:
+                    f.write(content)
+                os.replace(temp_file, self.path_for(content_hash))
+            self.index["files"][content_hash] = {"size": len(content), "last_used": time.time()}
+            self.index["urls"][url] = content_hash
+            self.evict()
+            self.save_index()
+        return content_hash
+
+    def forget(self, content_hash):
+        """Drop a file and every URL pointing at it"""
+        self.index["files"].pop(content_hash, None)
+        self.index["urls"] = {url: h for url, h in self.index["urls"].items() if h != content_hash}
+        try:
+            os.remove(self.path_for(content_hash))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Remove least recently used files until the cache fits in max_bytes"""
+        files = self.index["files"]
+        total = sum(entry["size"] for entry in files.values())
+        for content_hash in sorted(files, key=lambda h: files[h]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= files[content_hash]["size"]
+            self.forget(content_hash)
+
+
+def native_pixel_format(surface):
+    """Return the frombuffer format string matching a display surface's layout
+
+    Falls back to "RGB" when the display uses a layout frombuffer can't describe,
+    in which case surfaces still need a convert() before blitting quickly.
+    """
+    if surface.get_bitsize() == 32:
+        masks = surface.get_masks()[:3]
+        if masks == (0xff0000, 0xff00, 0xff):
+            return "BGRA"
+        if masks == (0xff, 0xff00, 0xff0000):
+            return "RGBX"
+    return "RGB"
+
+
+class PixelCache:
+    """Decoded map pixels stored on disk and memory-mapped on load
+
+    Each map is written once as raw pixels in the display's native format.
+    Loading it again maps the file and wraps it in a surface directly, with
+    no image decode and no copies; the OS pages pixels in as they are drawn.
+    """
+
+    def __init__(self, cache_dir="map_cache", max_bytes=2048 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def path_for(self, content_hash, pixel_format, size):
+        return os.path.join(
+            self.cache_dir, f"{content_hash}.{pixel_format}.{size[0]}x{size[1]}.pix")
+
+    def find(self, content_hash, pixel_format):
+        matches = glob.glob(os.path.join(self.cache_dir, f"{content_hash}.{pixel_format}.*.pix"))
+        if not matches:
+            return None, None
+        path = matches[0]
+        width, height = os.path.basename(path).split(".")[2].split("x")
+        return path, (int(width), int(height))
+
+    def load(self, content_hash, pixel_format):
+        """Return a surface backed by the cached pixels, or None"""
+        with self.lock:
+            path, size = self.find(content_hash, pixel_format)
+            if path is None:
+                return None
+            try:
+                with open(path, 'rb') as f:
+                    pixels = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                # The surface keeps a reference to the mapping for as long as it lives
+                surface = pygame.image.frombuffer(pixels, size, pixel_format)
+            except (OSError, ValueError) as e:
+                print(f"Error reading cached map pixels: {e}")
+                return None
+            os.utime(path)
+
+        if pixel_format in ("BGRA", "RGBX"):
+            # The fourth byte is padding, not alpha; blit as an opaque surface
+            surface.set_alpha(None)
+        return surface
+
+    def store(self, content_hash, surface, pixel_format):
+        """Write a decoded map to the cache and return it reloaded from the mapping"""
+        size = surface.get_size()
+        path = self.path_for(content_hash, pixel_format, size)
+        with self.lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_file = path + ".tmp"
+            with open(temp_file, 'wb') as f:
+                f.write(pygame.image.tobytes(surface, pixel_format))
+            os.replace(temp_file, path)
+            self.evict()
+        return self.load(content_hash, pixel_format) or surface
+
+    def evict(self):
+        """Remove least recently used pixel files until the cache fits in max_bytes"""
+        files = glob.glob(os.path.join(self.cache_dir, "*.pix"))
+        total = sum(os.path.getsize(path) for path in files)
+        for path in sorted(files, key=os.path.getmtime):
+            if total <= self.max_bytes:
+                break
+            total -= os.path.getsize(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,80 @@
+import codecs
+from html.parser import HTMLParser
+
+MAP_DIV_CLASS = "dominant_coal"
+MAP_LINK_MARKER = "missionmapimages"
+
+
+class MapLinkExtractor(HTMLParser):
+    """Streaming search for the current mission map link on the Combat Box homepage
+
+    Feed it the page as it arrives; once the first div.dominant_coal has
+    been seen through (link found, or div closed without one) it is done and
+    the rest of the page is never parsed. No tree is built. The page is
+    decoded as UTF-8, which is enough to find an ASCII URL in any
+    ASCII-compatible encoding.
+    """
+
+    FEED_SIZE = 4096
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        # Depth of nested divs while inside the map div, 0 outside it
+        self.div_depth = 0
+        self.map_url = None
+        self.done = False
+
+    def feed_bytes(self, chunk):
+        if self.done:
+            return
+        text = self.decoder.decode(chunk)
+        # HTMLParser always works through everything it is given, so feed it
+        # in small slices to stop close to where the link is
+        for start in range(0, len(text), self.FEED_SIZE):
+            if self.done:
+                return
+            self.feed(text[start:start + self.FEED_SIZE])
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "div":
+            if self.div_depth:
+                self.div_depth += 1
+            elif MAP_DIV_CLASS in (dict(attrs).get("class") or "").split():
+                self.div_depth = 1
+        elif tag == "a" and self.div_depth:
+            href = dict(attrs).get("href")
+            if href and MAP_LINK_MARKER in href:
+                self.map_url = href
+                self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "div" and self.div_depth and not self.done:
+            self.div_depth -= 1
+            if not self.div_depth:
+                # Only the first map div counts, as with soup.find()
+                self.done = True
+
+
+def find_map_link(chunks):
+    """Return the map link from an iterable of byte chunks, reading no further than needed"""
+    extractor = MapLinkExtractor()
+    for chunk in chunks:
+        extractor.feed_bytes(chunk)
+        if extractor.done:
+            break
+    return extractor.map_url
+
+
+def find_map_link_soup(text):
+    """Find the map link with a full BeautifulSoup parse; slower, but forgiving of odd markup"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(text, 'html.parser')
+    current_map_div = soup.find('div', class_=MAP_DIV_CLASS)
+    if current_map_div:
+        map_link = current_map_div.find('a', href=lambda x: x and MAP_LINK_MARKER in x)
+        if map_link:
+            return map_link['href']
+    return None
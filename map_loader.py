@@ -0,0 +1,444 @@
+import hashlib
+import queue
+import threading
+import time
+from io import BytesIO
+import pygame
+from map_pyramid import build_pyramid
+from surface_cache import SurfaceCache
+from tiled_map import TiledMap
+from map_link_parser import MapLinkExtractor, find_map_link_soup
+
+COMBAT_BOX_URL = "https://combatbox.net/en/"
+
+# PIL modes pygame can wrap without reshuffling pixels
+DIRECT_MODES = ("RGB", "RGBA", "RGBX")
+
+# PIL raw modes that write RGB pixels in each 32-bit layout native_pixel_format reports
+DISPLAY_RAW_MODES = {
+    "BGRA": "BGRX",
+    "RGBX": "RGBX",
+}
+# Rows unpacked per step when decoding straight into a display surface
+DECODE_BAND_ROWS = 256
+
+
+def pil_to_surface(image):
+    """Wrap a PIL image's pixels in a surface without an extra copy
+
+    The surface shares the buffer returned by tobytes(). Palette and
+    greyscale images become 8-bit palettized surfaces; anything else
+    pygame can't describe is converted to RGB(A) first.
+    """
+    if image.mode == "P" and "transparency" not in image.info:
+        surface = pygame.image.frombuffer(image.tobytes(), image.size, "P")
+        palette = image.getpalette() or []
+        surface.set_palette([tuple(palette[i:i + 3]) for i in range(0, len(palette) - 2, 3)])
+        return surface
+    if image.mode == "L":
+        surface = pygame.image.frombuffer(image.tobytes(), image.size, "P")
+        surface.set_palette([(i, i, i) for i in range(256)])
+        return surface
+    if image.mode not in DIRECT_MODES:
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    return pygame.image.frombuffer(image.tobytes(), image.size, image.mode)
+
+
+class MapLoadCancelled(Exception):
+    """Raised inside the worker when a newer request supersedes the current one"""
+
+
+class MapLoadResult:
+    def __init__(self, map_url, surface=None, pyramid=None, error=None, tiled=None,
+                 preview=False, map_size=None):
+        self.map_url = map_url
+        self.surface = surface
+        self.pyramid = pyramid
+        self.tiled = tiled
+        self.error = error
+        # A preview is a reduced-resolution copy standing in for a map of map_size
+        self.preview = preview
+        self.map_size = map_size or (surface.get_size() if surface is not None else None)
+
+
+class HttpStats:
+    """Counters for the loader's HTTP traffic"""
+
+    def __init__(self):
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_received = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+
+    def record(self, status_code, byte_count, latency):
+        self.requests += 1
+        if status_code == 304:
+            self.not_modified += 1
+        self.bytes_received += byte_count
+        self.total_latency += latency
+        self.last_latency = latency
+
+    @property
+    def not_modified_ratio(self):
+        return self.not_modified / self.requests if self.requests else 0.0
+
+    @property
+    def average_latency(self):
+        return self.total_latency / self.requests if self.requests else 0.0
+
+    def summary(self):
+        return (f"{self.requests} requests, {self.bytes_received / 1024:.1f} KiB received, "
+                f"{self.not_modified_ratio:.0%} not modified, "
+                f"avg latency {self.average_latency * 1000:.0f} ms")
+
+
+class MapLoader:
+    """Polls for the current map and downloads it on a background thread
+
+    Finished maps are handed to the main loop through a queue as
+    ready-to-blit surfaces, so the render loop never waits on the network.
+    """
+
+    def __init__(self, source_url=COMBAT_BOX_URL, check_interval=30, timeout=10, min_scale=0.2,
+                 map_cache=None, pixel_cache=None, pixel_format="RGB", display_format=None,
+                 tile_threshold=None, tile_size=512, tile_cache_bytes=128 * 1024 * 1024,
+                 preview_scale=8, restore_url=None, cache_all_pixels=True):
+        self.source_url = source_url
+        self.map_cache = map_cache
+        self.pixel_cache = pixel_cache
+        # Without this only maps big enough to be tiled go through the pixel
+        # cache; those always do, so their pixels are a memory-mapped file
+        # instead of a resident surface
+        self.cache_all_pixels = cache_all_pixels
+        self.pixel_format = pixel_format
+        # Small surface in the display's pixel format; decoded maps are converted to match it
+        self.display_format = display_format
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.min_scale = min_scale
+        self.chunk_size = 64 * 1024
+        # Maps with more pixel data than this are tiled instead of getting a pyramid
+        self.tile_threshold = tile_threshold
+        self.tile_size = tile_size
+        self.tile_cache_bytes = tile_cache_bytes
+        # JPEGs are first decoded at 1/preview_scale size for a quick first paint; 0 disables
+        self.preview_scale = preview_scale
+        # Map shown last time, loaded from the local caches before going online
+        self.restore_url = restore_url
+
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.generation = 0
+        self.force = False
+        self.current_map_url = None
+        self.thread = None
+
+        # Connections are reused across polls; only the worker thread touches them.
+        # requests, PIL and bs4 are slow to import, so they load on the worker too.
+        self.session = None
+        self.stats = HttpStats()
+        self.validators = {}
+        self.last_found_map_url = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="MapLoader", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=2):
+        """Cancel any download in progress and wait for the worker to exit"""
+        self.stopping.set()
+        with self.lock:
+            self.generation += 1
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+        if self.session is not None:
+            self.session.close()
+        if self.map_cache:
+            self.map_cache.flush()
+        print(f"Map loader network stats: {self.stats.summary()}")
+
+    def refresh(self):
+        """Cancel the current check and fetch the map again right away"""
+        with self.lock:
+            self.generation += 1
+            self.force = True
+        self.wake.set()
+
+    def poll(self):
+        """Return maps finished since the last call, dropping superseded ones"""
+        finished = []
+        while True:
+            try:
+                generation, result = self.results.get_nowait()
+            except queue.Empty:
+                return finished
+            if generation == self.generation:
+                finished.append(result)
+
+    def is_cancelled(self, generation):
+        return self.stopping.is_set() or generation != self.generation
+
+    def check_cancelled(self, generation):
+        if self.is_cancelled(generation):
+            raise MapLoadCancelled()
+
+    def get_session(self):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        return self.session
+
+    def run(self):
+        if self.restore_url:
+            self.restore_last_map()
+
+        while not self.stopping.is_set():
+            self.wake.clear()
+            with self.lock:
+                generation = self.generation
+                force = self.force
+                self.force = False
+
+            try:
+                self.check_for_new_map(generation, force)
+            except MapLoadCancelled:
+                continue
+
+            self.wake.wait(self.check_interval)
+
+    def restore_last_map(self):
+        """Show the last viewed map from the local caches while the first check runs"""
+        with self.lock:
+            generation = self.generation
+        try:
+            result = self.load_new_map(self.restore_url, generation, offline=True)
+            self.check_cancelled(generation)
+        except MapLoadCancelled:
+            return
+        if result is None or result.surface is None:
+            return
+        # The first check won't download it again if it is still current
+        self.current_map_url = result.map_url
+        self.results.put((generation, result))
+
+    def check_for_new_map(self, generation, force=False):
+        new_map_url = self.get_current_map_url(generation)
+        if new_map_url and (force or new_map_url != self.current_map_url):
+            print(f"Loading new map: {new_map_url}")
+            result = self.load_new_map(new_map_url, generation, force=force)
+            self.check_cancelled(generation)
+            self.current_map_url = new_map_url
+            self.results.put((generation, result))
+
+    def fetch(self, url, generation, conditional=False, on_chunk=None):
+        """Download url in chunks so a refresh or shutdown can abort it
+
+        With conditional set, the ETag/Last-Modified of the previous response
+        are sent back and None is returned as the content on a 304. on_chunk,
+        if given, sees each chunk of the body as it arrives.
+        """
+        headers = {}
+        validators = self.validators.get(url, {}) if conditional else {}
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        start_time = time.perf_counter()
+        byte_count = 0
+        response = None
+        try:
+            with self.get_session().get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                if response.status_code == 304:
+                    return response, None
+                response.raise_for_status()
+                data = BytesIO()
+                for chunk in response.iter_content(self.chunk_size):
+                    self.check_cancelled(generation)
+                    data.write(chunk)
+                    # Bytes read off the wire, before any gzip/deflate is undone
+                    byte_count = response.raw.tell()
+                    if on_chunk is not None:
+                        on_chunk(chunk)
+
+                if conditional:
+                    self.validators[url] = {}
+                    if response.headers.get("ETag"):
+                        self.validators[url]["etag"] = response.headers["ETag"]
+                    if response.headers.get("Last-Modified"):
+                        self.validators[url]["last_modified"] = response.headers["Last-Modified"]
+                return response, data.getvalue()
+        finally:
+            if response is not None:
+                self.stats.record(response.status_code, byte_count, time.perf_counter() - start_time)
+
+    def get_current_map_url(self, generation):
+        try:
+            # The link is picked out while the page downloads, and parsing stops
+            # once it is found. The rest of the body is still read, which is
+            # cheap, so the connection can go back to the pool for the next poll.
+            extractor = MapLinkExtractor()
+            response, content = self.fetch(
+                self.source_url, generation, conditional=True, on_chunk=extractor.feed_bytes)
+            if content is None:
+                # Homepage unchanged since the last poll, so neither is the map
+                return self.last_found_map_url
+            map_url = extractor.map_url
+            if map_url is None:
+                # Possibly markup the streaming parser can't follow; try a full parse
+                map_url = find_map_link_soup(content.decode(response.encoding or "utf-8", errors="replace"))
+            self.last_found_map_url = map_url
+            return self.last_found_map_url
+        except MapLoadCancelled:
+            raise
+        except Exception as e:
+            print(f"Error fetching map URL: {e}")
+            return None
+
+    def load_new_map(self, map_url, generation, offline=False, force=False):
+        """Load a map from the caches or the network; offline only uses the caches
+
+        force (an explicit refresh) always downloads the image again. Returns
+        None when offline and the map isn't cached.
+        """
+        try:
+            surface = None if force else self.load_cached_pixels(map_url)
+            from_cache = surface is not None
+            if surface is None:
+                surface, from_cache = self.download_and_decode(map_url, generation, offline, force)
+                if surface is None:
+                    return None
+            self.check_cancelled(generation)
+            pyramid = tiled = None
+            if self.should_tile(surface):
+                # Smaller levels are shrunk tile by tile as they are drawn
+                tiled = TiledMap(surface, self.tile_size, self.min_scale, self.tile_cache_bytes)
+            else:
+                pyramid = build_pyramid(surface, self.min_scale)
+            print(f"Successfully loaded new map{' from cache' if from_cache else ''}")
+            return MapLoadResult(map_url, surface, pyramid, tiled=tiled)
+        except MapLoadCancelled:
+            raise
+        except Exception as e:
+            print(f"Error loading map: {e}")
+            return MapLoadResult(map_url, error=e)
+
+    def should_tile(self, surface):
+        return bool(self.tile_threshold) and SurfaceCache.surface_size(surface) > self.tile_threshold
+
+    def load_cached_pixels(self, map_url):
+        """Map previously decoded pixels straight into a surface, skipping the decode"""
+        if not self.pixel_cache or not self.map_cache:
+            return None
+        content_hash = self.map_cache.content_hash(map_url)
+        if content_hash is None:
+            return None
+        surface = self.pixel_cache.load(content_hash, self.pixel_format)
+        if surface is not None:
+            # Keep the source image as fresh as its pixels so eviction doesn't orphan them
+            self.map_cache.touch(map_url)
+        return surface
+
+    def download_and_decode(self, map_url, generation, offline=False, force=False):
+        content = self.map_cache.get(map_url) if self.map_cache and not force else None
+        from_cache = content is not None
+        if not from_cache:
+            if offline:
+                return None, False
+            _, content = self.fetch(map_url, generation)
+        self.check_cancelled(generation)
+        if self.preview_scale:
+            self.publish_preview(map_url, content, generation)
+        surface = self.decode_map(content)
+
+        # Only images that decoded cleanly are worth keeping
+        if self.map_cache and not from_cache:
+            content_hash = self.map_cache.put(map_url, content)
+        else:
+            content_hash = hashlib.sha256(content).hexdigest()
+        if self.pixel_cache and (self.cache_all_pixels or self.should_tile(surface)):
+            # The decoded surface is dropped for one backed by the cached file
+            surface = self.pixel_cache.store(content_hash, surface, self.pixel_format)
+        return surface, from_cache
+
+    def publish_preview(self, map_url, content, generation):
+        """Hand the main loop a reduced-resolution copy to show while the full decode runs"""
+        try:
+            preview, map_size = self.decode_preview(content)
+        except Exception as e:
+            print(f"Error decoding map preview: {e}")
+            return
+        if preview is None:
+            return
+        self.check_cancelled(generation)
+        self.results.put((generation, MapLoadResult(
+            map_url, preview, [preview], preview=True, map_size=map_size)))
+
+    def decode_preview(self, content):
+        """Decode a JPEG at reduced scale, returning (surface, full size) or (None, None)
+
+        JPEG can skip most of the work by decoding DCT blocks at 1/2, 1/4 or
+        1/8 scale. Other formats would need a full decode first, so they get
+        no preview.
+        """
+        from PIL import Image
+        with Image.open(BytesIO(content)) as image:
+            map_size = image.size
+            if image.format != "JPEG":
+                return None, None
+            image.draft("RGB", (map_size[0] // self.preview_scale, map_size[1] // self.preview_scale))
+            surface = pil_to_surface(image)
+        if self.display_format is not None:
+            surface = surface.convert(self.display_format)
+        return surface, map_size
+
+    def decode_map(self, content):
+        """Decode an image into a surface in the display's pixel format
+
+        RGB images (every JPEG map) are unpacked by PIL straight into the
+        display's 32-bit layout, a band of rows at a time, so there is no
+        convert() and no full-size intermediate buffer. Other images are
+        converted once. The PIL image is closed as soon as it has been read,
+        so no more than two full copies of the map ever exist at once.
+        """
+        from PIL import Image
+        image = Image.open(BytesIO(content))
+        try:
+            raw_mode = DISPLAY_RAW_MODES.get(self.pixel_format) if self.display_format is not None else None
+            if raw_mode and image.mode == "RGB":
+                return self.unpack_to_display(image, raw_mode)
+            surface = pil_to_surface(image)
+        finally:
+            # Frees the decoded pixels, which leaving a with block doesn't
+            image.close()
+        if self.display_format is None:
+            return surface
+        return surface.convert(self.display_format)
+
+    def unpack_to_display(self, image, raw_mode):
+        """Copy an RGB image into a new display-format surface, DECODE_BAND_ROWS rows at a time"""
+        width, height = image.size
+        surface = pygame.Surface((width, height), 0, self.display_format)
+        pitch = surface.get_pitch()
+        row_bytes = width * 4
+        pixels = surface.get_buffer()
+        for top in range(0, height, DECODE_BAND_ROWS):
+            bottom = min(height, top + DECODE_BAND_ROWS)
+            data = image.crop((0, top, width, bottom)).tobytes("raw", raw_mode)
+            if pitch == row_bytes:
+                pixels.write(data, top * pitch)
+            else:
+                for row in range(bottom - top):
+                    pixels.write(data[row * row_bytes:(row + 1) * row_bytes], (top + row) * pitch)
+        # Releases the lock the buffer holds on the surface
+        del pixels
+        return surface
@@ -0,0 +1,52 @@
+import pygame
+
+
+def shrink_surface(surface, size):
+    """Downscale a surface, filtering when the pixel format allows it"""
+    if surface.get_bitsize() in (24, 32):
+        return pygame.transform.smoothscale(surface, size)
+    return pygame.transform.scale(surface, size)
+
+
+def halve_surface(surface):
+    """Downscale a surface to half size"""
+    return shrink_surface(surface, half_size(surface.get_size()))
+
+
+def half_size(size):
+    return (max(1, size[0] // 2), max(1, size[1] // 2))
+
+
+def level_sizes(size, min_scale=0.2, min_size=16):
+    """Sizes of the pyramid levels build_pyramid makes for a map of this size"""
+    sizes = [size]
+    scale = 1.0
+    while scale / 2 >= min_scale and min(sizes[-1]) // 2 >= min_size:
+        sizes.append(half_size(sizes[-1]))
+        scale /= 2
+    return sizes
+
+
+def build_pyramid(surface, min_scale=0.2, min_size=16):
+    """Build pre-downscaled copies of a map at 1, 1/2, 1/4 ... scale
+
+    Levels stop once the next one would be below min_scale (it would never
+    be picked) or smaller than min_size pixels on a side.
+    """
+    levels = [surface]
+    for _ in level_sizes(surface.get_size(), min_scale, min_size)[1:]:
+        levels.append(halve_surface(levels[-1]))
+    return levels
+
+
+def pick_level(pyramid, zoom):
+    """Return the index of the smallest level whose scale is at or above zoom
+
+    pyramid only needs a length, so a list of level sizes works too.
+    """
+    index = 0
+    scale = 1.0
+    while index + 1 < len(pyramid) and scale / 2 >= zoom - 1e-6:
+        index += 1
+        scale /= 2
+    return index
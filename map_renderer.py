@@ -0,0 +1,250 @@
+import math
+import pygame
+from surface_cache import ScaledSurfaceCache
+from map_pyramid import build_pyramid, pick_level
+from scale_worker import ScaleJob
+
+
+class MapRenderer:
+    """Draws the current map surface through a Viewport
+
+    With a compositor, full-size scaled layers are built on a worker thread
+    and the visible crop is scaled directly until the layer is ready, so no
+    frame waits on scaling the whole map. Very large maps come as a TiledMap
+    instead of a pyramid, and are always drawn from the visible tiles; with a
+    compositor, missing tiles are shrunk on its thread and the nearest finer
+    level that is complete is drawn until they arrive.
+
+    Workers are handed map pixels without copying them. That is safe because
+    pyramid levels and tiles are never drawn onto once built, and this side
+    only reads them through subsurfaces and transforms: a surface a worker
+    has locked for scaling is never the source of a blit here.
+    """
+
+    def __init__(self, min_scale=0.2, full_scale_limit=2.0, refiner=None, compositor=None):
+        # Smallest zoom the viewer allows; pyramid levels below it are never built
+        self.min_scale = min_scale
+        # Largest scaled map, relative to the screen area, that is scaled
+        # and cached as a whole. Anything bigger is cropped to the viewport.
+        self.full_scale_limit = full_scale_limit
+        self.surface = None
+        self.pyramid = []
+        self.tiled = None
+        self.map_id = 0
+        self.scaled_cache = ScaledSurfaceCache()
+        # Optional ScaleWorker that smoothscales the settled view in the background
+        self.refiner = refiner
+        self.refined = None
+        self.pending_key = None
+        # Optional ScaleWorker that builds full-size layers in the background
+        self.compositor = compositor
+        self.pending_layer_key = None
+        self.pending_tile_key = None
+        # Counts tiles installed from the compositor, so a frame drawn in their place is redrawn
+        self.tiles_built = 0
+
+    def set_map(self, surface, pyramid=None, tiled=None):
+        """Install a new map surface and drop scaled copies of the previous one"""
+        self.surface = surface
+        self.tiled = tiled
+        if tiled is not None:
+            self.pyramid = []
+        else:
+            self.pyramid = pyramid if pyramid is not None else build_pyramid(surface, self.min_scale)
+        self.map_id += 1
+        self.scaled_cache.clear()
+        self.refined = None
+        self.pending_key = None
+        self.pending_layer_key = None
+        self.pending_tile_key = None
+
+    @property
+    def levels(self):
+        return self.tiled.levels if self.tiled is not None else self.pyramid
+
+    def level_size(self, level):
+        if self.tiled is not None:
+            return self.tiled.level_size(level)
+        return self.pyramid[level].get_size()
+
+    def level_region(self, level, rect):
+        """Pixels of rect at a pyramid level"""
+        if self.tiled is not None:
+            return self.tiled.region(level, rect)
+        return self.pyramid[level].subsurface(rect)
+
+    def frame_key(self, screen_size, viewport):
+        """Identifies what a frame of the map looks like, for matching refined frames"""
+        return (self.map_id, viewport.transform, screen_size)
+
+    @property
+    def refined_key(self):
+        return self.refined.key if self.refined else None
+
+    def refine(self, screen_size, viewport):
+        """Ask the refiner for a smoothscaled copy of the current view, if not already done"""
+        if self.refiner is None or self.surface is None:
+            return
+        key = self.frame_key(screen_size, viewport)
+        if key == self.pending_key or key == self.refined_key:
+            return
+
+        scaled_width, scaled_height = viewport.scaled_size
+        if scaled_width <= 0 or scaled_height <= 0:
+            return
+        display_x, display_y = viewport.origin
+        level, geometry = self.drawable_level(
+            screen_size, pick_level(self.levels, viewport.zoom), display_x, display_y, scaled_width, scaled_height)
+        if geometry is None:
+            return
+        source_rect, dest_rect = geometry
+
+        crop = self.level_region(level, source_rect)
+        self.refiner.submit(ScaleJob(key, crop, dest_rect.size, "smooth", dest_rect))
+        self.pending_key = key
+
+    def poll(self):
+        """Install finished background layers and the refined frame for the current request"""
+        if self.compositor is not None:
+            for job in self.compositor.poll():
+                if job.key[0] == "tile":
+                    _, map_id, level, tile_x, tile_y = job.key
+                    if map_id == self.map_id:
+                        self.tiled.put_tile(level, tile_x, tile_y, job.surface)
+                        self.tiles_built += 1
+                    if job.key == self.pending_tile_key:
+                        self.pending_tile_key = None
+                    continue
+                # Layers for a previous map are no use
+                if job.key[0] == self.map_id:
+                    self.scaled_cache.put(job.key, job.surface)
+                if job.key == self.pending_layer_key:
+                    self.pending_layer_key = None
+        if self.refiner is not None:
+            for job in self.refiner.poll():
+                if job.key == self.pending_key:
+                    self.refined = job
+
+    def draw(self, screen, viewport, fast=False):
+        """Draw the map; fast frames skip the scaled cache and only scale what is visible
+
+        Fast frames are for animations, where every frame has a new zoom and a
+        cached full-size scale would never be reused.
+        """
+        if self.surface is None:
+            return
+
+        screen_width, screen_height = screen.get_size()
+        zoom = viewport.zoom
+        scaled_width, scaled_height = viewport.scaled_size
+        if scaled_width <= 0 or scaled_height <= 0:
+            return
+
+        display_x, display_y = viewport.origin
+
+        # A smoothscaled frame of exactly this view is ready
+        if not fast and self.refined_key == self.frame_key((screen_width, screen_height), viewport):
+            screen.blit(self.refined.surface, self.refined.dest_rect)
+            return
+
+        # Scale from the nearest pre-downscaled level at or above the target zoom
+        level_index = pick_level(self.levels, zoom)
+
+        if (fast or self.tiled is not None
+                or scaled_width * scaled_height > self.full_scale_limit * screen_width * screen_height):
+            self.draw_cropped(screen, level_index, display_x, display_y, scaled_width, scaled_height)
+            return
+
+        level = self.pyramid[level_index]
+        if self.compositor is None:
+            scaled_surface = self.scaled_cache.get_scaled(
+                self.map_id, level, zoom, size=(scaled_width, scaled_height))
+            screen.blit(scaled_surface, (display_x, display_y))
+        else:
+            key = self.scaled_cache.scaled_key(self.map_id, zoom)
+            scaled_surface = self.scaled_cache.get(key)
+            if scaled_surface is not None:
+                screen.blit(scaled_surface, (display_x, display_y))
+                return
+            if key != self.pending_layer_key:
+                self.compositor.submit(ScaleJob(key, level, (scaled_width, scaled_height)))
+                self.pending_layer_key = key
+            # Same pixel grid as the layer will have, at a cost bounded by the screen size
+            self.draw_cropped(screen, level_index, display_x, display_y, scaled_width, scaled_height)
+
+    @staticmethod
+    def visible_source_rect(screen_size, source_size, display_x, display_y, scaled_width, scaled_height):
+        """Return the part of a source of source_size (in its own pixels) that is visible on screen"""
+        visible = pygame.Rect(display_x, display_y, scaled_width, scaled_height).clip(
+            pygame.Rect((0, 0), screen_size))
+        if visible.width <= 0 or visible.height <= 0:
+            return None
+
+        zoom_x = scaled_width / source_size[0]
+        zoom_y = scaled_height / source_size[1]
+
+        # Widen to whole source pixels so the edges of the screen stay covered
+        left = max(0, math.floor((visible.left - display_x) / zoom_x))
+        top = max(0, math.floor((visible.top - display_y) / zoom_y))
+        right = min(source_size[0], math.ceil((visible.right - display_x) / zoom_x))
+        bottom = min(source_size[1], math.ceil((visible.bottom - display_y) / zoom_y))
+        if right <= left or bottom <= top:
+            return None
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def crop_geometry(self, screen_size, source_size, display_x, display_y, scaled_width, scaled_height):
+        """Return (source_rect, dest_rect) for drawing just the visible part of a source"""
+        source_rect = self.visible_source_rect(
+            screen_size, source_size, display_x, display_y, scaled_width, scaled_height)
+        if source_rect is None:
+            return None
+
+        zoom_x = scaled_width / source_size[0]
+        zoom_y = scaled_height / source_size[1]
+
+        # Snap both edges to the same grid the full-size scale would use
+        dest_left = display_x + round(source_rect.left * zoom_x)
+        dest_top = display_y + round(source_rect.top * zoom_y)
+        dest_width = display_x + round(source_rect.right * zoom_x) - dest_left
+        dest_height = display_y + round(source_rect.bottom * zoom_y) - dest_top
+        if dest_width <= 0 or dest_height <= 0:
+            return None
+        return source_rect, pygame.Rect(dest_left, dest_top, dest_width, dest_height)
+
+    def drawable_level(self, screen_size, level, display_x, display_y, scaled_width, scaled_height):
+        """Return (level, crop geometry) to draw the view from, starting at level
+
+        On a tiled map with a compositor, the first tile missing from level is
+        queued for it and the nearest finer level whose visible tiles are all
+        built stands in. Level 0 never has missing tiles.
+        """
+        geometry = self.crop_geometry(
+            screen_size, self.level_size(level), display_x, display_y, scaled_width, scaled_height)
+        if geometry is None or self.tiled is None or self.compositor is None:
+            return level, geometry
+        missing = self.tiled.missing_tiles(level, geometry[0])
+        if not missing:
+            return level, geometry
+
+        tile_x, tile_y = missing[0]
+        key = ("tile", self.map_id, level, tile_x, tile_y)
+        if key != self.pending_tile_key:
+            size = self.tiled.tile_rect(level, tile_x, tile_y).size
+            self.compositor.submit(ScaleJob(key, self.tiled.tile_source(level, tile_x, tile_y), size, "smooth"))
+            self.pending_tile_key = key
+
+        for finer in range(level - 1, -1, -1):
+            geometry = self.crop_geometry(
+                screen_size, self.level_size(finer), display_x, display_y, scaled_width, scaled_height)
+            if geometry is None or not self.tiled.missing_tiles(finer, geometry[0]):
+                return finer, geometry
+
+    def draw_cropped(self, screen, level, display_x, display_y, scaled_width, scaled_height):
+        """Scale only the visible part of a level, so the cost depends on the window size"""
+        level, geometry = self.drawable_level(
+            screen.get_size(), level, display_x, display_y, scaled_width, scaled_height)
+        if geometry is None:
+            return
+        source_rect, dest_rect = geometry
+        cropped = pygame.transform.scale(self.level_region(level, source_rect), dest_rect.size)
+        screen.blit(cropped, dest_rect)
@@ -0,0 +1,92 @@
+import queue
+import threading
+import pygame
+from surface_cache import ScaledSurfaceCache
+
+# Posted when a job finishes, so an idle main loop wakes up to use it
+SCALED_EVENT = pygame.event.custom_type()
+
+
+class ScaleJob:
+    """A surface to scale to size, with the key its result will be filed under"""
+
+    def __init__(self, key, source, size, mode="fast", dest_rect=None):
+        self.key = key
+        self.source = source
+        self.size = size
+        self.mode = mode
+        # Where the result goes on screen, for jobs that cover part of a frame
+        self.dest_rect = dest_rect
+        self.surface = None
+
+
+class ScaleWorker:
+    """Scales surfaces on a background thread
+
+    pygame's transform functions release the GIL while they work, so a large
+    scale runs alongside the main loop instead of stalling it. Only the most
+    recent request matters: a new one supersedes any job still waiting, and
+    callers drop results whose key is no longer wanted.
+    """
+
+    def __init__(self, name="ScaleWorker"):
+        self.name = name
+        self.jobs = queue.Queue(maxsize=1)
+        self.results = queue.Queue()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=2):
+        self.stopping.set()
+        self.submit(None)
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def submit(self, job):
+        """Queue job, replacing one that hasn't been started yet"""
+        while True:
+            try:
+                self.jobs.put_nowait(job)
+                return
+            except queue.Full:
+                try:
+                    self.jobs.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def poll(self):
+        """Return jobs finished since the last call"""
+        finished = []
+        while True:
+            try:
+                finished.append(self.results.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def run(self):
+        while not self.stopping.is_set():
+            job = self.jobs.get()
+            if job is None:
+                continue
+            try:
+                source = job.source
+                if job.mode == "smooth" and source.get_bitsize() < 24:
+                    # smoothscale only handles 24 and 32 bit surfaces
+                    source = source.convert(24, 0)
+                job.surface = ScaledSurfaceCache.SCALERS[job.mode](source, job.size)
+            except Exception as e:
+                print(f"Error scaling map in {self.name}: {e}")
+                continue
+            self.results.put(job)
+            try:
+                pygame.event.post(pygame.event.Event(SCALED_EVENT))
+            except pygame.error:
+                pass
@@ -1,8 +1,8 @@
 # settings.py
+import copy
 import json
 import os
 import pygame
-import win32con
 
 class Settings:
     def __init__(self):
@@ -18,18 +18,58 @@ class Settings:
                 "zoom_in": {"type": "keyboard", "value": pygame.K_PLUS},
                 "zoom_out": {"type": "keyboard", "value": pygame.K_MINUS},
                 "reset_view": {"type": "keyboard", "value": pygame.K_r}
-            }
+            },
+            "map_source_url": "https://combatbox.net/en/",
+            "map_check_interval": 30,
+            "network_timeout": 10,
+            "map_cache_dir": "map_cache",
+            "map_cache_mb": 500,
+            "use_pixel_cache": False,
+            "pixel_cache_mb": 2048,
+            "redraw_on_demand": True,
+            "active_fps": 60,
+            "idle_fps": 4,
+            "idle_after": 0.5,
+            "input_backend": "auto",
+            "input_script": None,
+            "input_script_repeat": False,
+            "axis_binds": {
+                "pan_horizontal": None,
+                "pan_vertical": None,
+                "zoom": None,
+                "pan_hat": None
+            },
+            "axis_deadzone": 0.15,
+            "axis_curve": 2.0,
+            "axis_pan_speed": 900,
+            "axis_zoom_speed": 1.0,
+            "camera_pan_speed": 1200,
+            "camera_acceleration": 6000,
+            "camera_zoom_time": 0.1,
+            "camera_zoom_speed": 1.0,
+            "smooth_when_idle": True,
+            "refine_delay": 0.2,
+            "background_scaling": True,
+            "tile_threshold_mb": 128,
+            "tile_size": 512,
+            "tile_cache_mb": 128,
+            "map_preview_scale": 8,
+            "restore_last_map": True,
+            "last_map_url": None,
+            "last_view": None
         }
         self.settings = self.load_settings()
 
     def load_settings(self):
+        settings = copy.deepcopy(self.default_settings)
         try:
             if os.path.exists(self.config_file):
                 with open(self.config_file, 'r') as f:
-                    return json.load(f)
-            return self.default_settings.copy()
+                    # Options added since the file was written keep their defaults
+                    settings.update(json.load(f))
+            return settings
         except:
-            return self.default_settings.copy()
+            return copy.deepcopy(self.default_settings)
 
     def save_settings(self):
         with open(self.config_file, 'w') as f:
@@ -0,0 +1,63 @@
+import math
+
+
+class GridIndex:
+    """Uniform grid over map coordinates for fast hit-testing
+
+    Each key (a waypoint or a leg) remembers the cells it was filed under,
+    so it can be moved or removed without rebuilding the grid.
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.key_cells = {}
+
+    def cell_of(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def insert_point(self, key, x, y):
+        self.insert(key, {self.cell_of(x, y)})
+
+    def insert_segment(self, key, x1, y1, x2, y2):
+        """File a segment under every cell it passes through, sampled every half cell"""
+        steps = max(1, math.ceil(math.hypot(x2 - x1, y2 - y1) / (self.cell_size / 2)))
+        cells = {self.cell_of(x1 + (x2 - x1) * i / steps, y1 + (y2 - y1) * i / steps)
+                 for i in range(steps + 1)}
+        self.insert(key, cells)
+
+    def insert(self, key, cells):
+        self.remove(key)
+        self.key_cells[key] = cells
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        for cell in self.key_cells.pop(key, ()):
+            keys = self.cells.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.cells[cell]
+
+    def query(self, x, y, radius):
+        """Return the keys filed in any cell within radius of (x, y)
+
+        Results are candidates only; callers check exact distances.
+        """
+        # Segments are sampled every half cell, so widen the search by a quarter cell
+        reach = radius + self.cell_size / 4
+        min_cell = self.cell_of(x - reach, y - reach)
+        max_cell = self.cell_of(x + reach, y + reach)
+        found = set()
+        for cell_x in range(min_cell[0], max_cell[0] + 1):
+            for cell_y in range(min_cell[1], max_cell[1] + 1):
+                found.update(self.cells.get((cell_x, cell_y), ()))
+        return found
+
+    def clear(self):
+        self.cells.clear()
+        self.key_cells.clear()
+
+    def __len__(self):
+        return len(self.key_cells)
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+import pygame
+
+
+class SurfaceCache:
+    """Memory-bounded LRU cache of surfaces"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def surface_size(surface):
+        """Approximate memory used by a surface's pixel data"""
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    def get(self, key):
+        surface = self.entries.get(key)
+        if surface is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return surface
+
+    def put(self, key, surface):
+        size = self.surface_size(surface)
+        if key in self.entries:
+            self.current_bytes -= self.surface_size(self.entries.pop(key))
+
+        # Surfaces larger than the whole budget are never kept
+        if size > self.max_bytes:
+            return
+
+        self.entries[key] = surface
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.current_bytes -= self.surface_size(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.current_bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+
+class ScaledSurfaceCache(SurfaceCache):
+    """Caches scaled copies of a map keyed by (map id, zoom, scaling mode)"""
+
+    SCALERS = {
+        "fast": pygame.transform.scale,
+        "smooth": pygame.transform.smoothscale,
+    }
+
+    @staticmethod
+    def scaled_key(map_id, zoom, mode="fast"):
+        return (map_id, round(zoom, 4), mode)
+
+    def get_scaled(self, map_id, surface, zoom, mode="fast", size=None):
+        key = self.scaled_key(map_id, zoom, mode)
+        scaled = self.get(key)
+        if scaled is None:
+            if size is None:
+                size = (max(1, int(surface.get_width() * zoom)),
+                        max(1, int(surface.get_height() * zoom)))
+            scaled = self.SCALERS[mode](surface, size)
+            self.put(key, scaled)
+        return scaled
@@ -0,0 +1,167 @@
+"""MapLoader against a local stand-in for the Combat Box site"""
+import io
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pygame
+from PIL import Image
+from map_cache import MapImageCache
+from map_loader import MapLoader
+
+
+def make_jpeg(size=(64, 48)):
+    data = io.BytesIO()
+    Image.new("RGB", size, (40, 120, 200)).save(data, "JPEG")
+    return data.getvalue()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves a homepage linking to /map.jpg, with switchable slow responses"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        if self.path.startswith("/slow-home"):
+            time.sleep(server.home_delay)
+        if self.path in ("/", "/slow-home/"):
+            base = f"http://127.0.0.1:{server.server_port}"
+            body = (f'<html><body><div class="dominant_coal">'
+                    f'<a href="{base}/map.jpg?missionmapimages">map</a></div></body></html>').encode()
+            self.send_body(body, "text/html")
+        elif self.path.startswith("/map.jpg"):
+            self.send_map()
+        else:
+            self.send_error(404)
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_map(self):
+        server = self.server
+        body = server.map_bytes
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not server.slow_maps:
+            self.wfile.write(body)
+            return
+        # Trickle the first map out so a refresh can land mid-download
+        server.slow_maps -= 1
+        server.map_started.set()
+        try:
+            for start in range(0, len(body), 64):
+                self.wfile.write(body[start:start + 64])
+                self.wfile.flush()
+                time.sleep(0.05)
+        except OSError:
+            server.aborted_maps += 1
+
+
+class MapLoaderTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.home_delay = 0
+        self.server.slow_maps = 0
+        self.server.aborted_maps = 0
+        self.server.map_started = threading.Event()
+        # Big enough (with trickling) that downloading it takes a few seconds
+        self.server.map_bytes = make_jpeg((256, 192)) + b"\0" * 4096
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.loader = None
+
+    def tearDown(self):
+        if self.loader:
+            self.loader.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_for_results(self, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            results = self.loader.poll()
+            if results:
+                return results
+            time.sleep(0.02)
+        self.fail("loader produced no map")
+
+    def test_loads_current_map(self):
+        self.loader = MapLoader(self.base_url + "/", preview_scale=0)
+        self.loader.start()
+        results = self.wait_for_results()
+
+        self.assertEqual(len(results), 1)
+        result = results[0]
+        self.assertIsNone(result.error)
+        self.assertEqual(result.map_url, self.base_url + "/map.jpg?missionmapimages")
+        self.assertEqual(result.surface.get_size(), (256, 192))
+        self.assertEqual(self.loader.current_map_url, result.map_url)
+
+    def test_homepage_timeout_gives_no_map(self):
+        self.server.home_delay = 1.0
+        self.loader = MapLoader(self.base_url + "/slow-home/", timeout=0.2)
+
+        start = time.perf_counter()
+        self.assertIsNone(self.loader.get_current_map_url(self.loader.generation))
+        self.assertLess(time.perf_counter() - start, 0.9)
+
+    def test_refresh_cancels_download_in_progress(self):
+        self.server.slow_maps = 1
+        self.loader = MapLoader(self.base_url + "/", preview_scale=0)
+        # Cancellation is checked between chunks; small ones make it prompt
+        self.loader.chunk_size = 256
+        self.loader.start()
+        self.assertTrue(self.server.map_started.wait(5))
+
+        self.loader.refresh()
+        results = self.wait_for_results()
+
+        # Only the reload made after the refresh is delivered, complete
+        self.assertEqual(len(results), 1)
+        self.assertIsNone(results[0].error)
+        self.assertEqual(results[0].surface.get_size(), (256, 192))
+        map_requests = [path for path in self.server.requests if path.startswith("/map.jpg")]
+        self.assertEqual(len(map_requests), 2)
+
+    def test_refresh_downloads_cached_map_again(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            map_cache = MapImageCache(cache_dir)
+            self.loader = MapLoader(self.base_url + "/", preview_scale=0, map_cache=map_cache)
+            self.loader.start()
+            map_url = self.wait_for_results()[0].map_url
+
+            self.loader.refresh()
+            self.assertIsNone(self.wait_for_results()[0].error)
+            map_requests = [path for path in self.server.requests if path.startswith("/map.jpg")]
+            self.assertEqual(len(map_requests), 2)
+
+            # A cache hit only marks the index dirty; stopping the loader writes it
+            with open(map_cache.index_file) as f:
+                saved_index = f.read()
+            self.assertIsNotNone(map_cache.get(map_url))
+            with open(map_cache.index_file) as f:
+                self.assertEqual(f.read(), saved_index)
+            self.loader.stop()
+            self.loader = None
+            with open(map_cache.index_file) as f:
+                self.assertNotEqual(f.read(), saved_index)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+import pygame
+
+
+class TextCache:
+    """Shared fonts and rendered text surfaces
+
+    Fonts are loaded once per (name, size). Rendered text is kept in an
+    LRU keyed by (font, size, text, color, antialias), so labels that
+    rarely change are only rasterized once.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+
+    def get_font(self, size, name=None):
+        key = (name, size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = pygame.font.Font(name, size)
+            self.fonts[key] = font
+        return font
+
+    def render(self, text, size, color, antialias=True, name=None):
+        key = (name, size, text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = self.get_font(size, name).render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.fonts.clear()
+        self.surfaces.clear()
+
+
+text_cache = TextCache()
+
+
+def render_text(text, size, color, antialias=True, name=None):
+    return text_cache.render(text, size, color, antialias, name)
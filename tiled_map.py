@@ -0,0 +1,105 @@
+import math
+import pygame
+from surface_cache import SurfaceCache
+from map_pyramid import level_sizes, shrink_surface
+
+
+class TiledMap:
+    """A map split into fixed-size tiles at each pyramid level, built on demand
+
+    Level 0 tiles are subsurfaces of the source, so they cost no memory of
+    their own (and with the pixel cache the source is a memory-mapped file).
+    Each tile of a smaller level is shrunk from the same area of the source
+    and kept in an LRU cache with a byte budget. Tiles can be shrunk
+    elsewhere (from tile_source) and added with put_tile; region() shrinks
+    any that are still missing itself. Only tiles that intersect the
+    requested region are touched.
+    """
+
+    def __init__(self, surface, tile_size=512, min_scale=0.2, max_bytes=128 * 1024 * 1024):
+        self.surface = surface
+        self.tile_size = tile_size
+        self.levels = level_sizes(surface.get_size(), min_scale)
+        self.tiles = SurfaceCache(max_bytes)
+
+    def get_size(self):
+        return self.surface.get_size()
+
+    def level_size(self, level):
+        return self.levels[level]
+
+    def tile_rect(self, level, tile_x, tile_y):
+        """Pixels covered by a tile, in level coordinates"""
+        rect = pygame.Rect(tile_x * self.tile_size, tile_y * self.tile_size, self.tile_size, self.tile_size)
+        return rect.clip(pygame.Rect((0, 0), self.levels[level]))
+
+    def tiles_in(self, rect):
+        """(tile_x, tile_y) of every tile intersecting rect"""
+        first_x = rect.left // self.tile_size
+        first_y = rect.top // self.tile_size
+        last_x = math.ceil(rect.right / self.tile_size)
+        last_y = math.ceil(rect.bottom / self.tile_size)
+        for tile_y in range(first_y, last_y):
+            for tile_x in range(first_x, last_x):
+                yield tile_x, tile_y
+
+    def tile_source(self, level, tile_x, tile_y):
+        """The area of the source a tile is shrunk from"""
+        rect = self.tile_rect(level, tile_x, tile_y)
+        # Each level halves the one above, so a tile covers 2**level times its
+        # size in the source, except that tiles on the far edges also take the
+        # odd pixels the halvings dropped
+        factor = 2 ** level
+        width, height = self.levels[level]
+        source_width, source_height = self.levels[0]
+        right = source_width if rect.right == width else rect.right * factor
+        bottom = source_height if rect.bottom == height else rect.bottom * factor
+        return self.surface.subsurface(
+            pygame.Rect(rect.x * factor, rect.y * factor, right - rect.x * factor, bottom - rect.y * factor))
+
+    def missing_tiles(self, level, rect):
+        """(tile_x, tile_y) of the tiles rect needs at a level that aren't built yet"""
+        if level == 0:
+            return []
+        return [(tile_x, tile_y) for tile_x, tile_y in self.tiles_in(rect)
+                if (level, tile_x, tile_y) not in self.tiles]
+
+    def put_tile(self, level, tile_x, tile_y, tile):
+        self.tiles.put((level, tile_x, tile_y), tile)
+
+    def tile(self, level, tile_x, tile_y):
+        rect = self.tile_rect(level, tile_x, tile_y)
+        if level == 0:
+            return self.surface.subsurface(rect)
+
+        key = (level, tile_x, tile_y)
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = shrink_surface(self.tile_source(level, tile_x, tile_y), rect.size)
+            self.tiles.put(key, tile)
+        return tile
+
+    def region(self, level, rect):
+        """Return the pixels of rect at a level, assembled from the tiles it covers
+
+        The result may share pixels with the source or a cached tile. Tiles
+        are only ever read through subsurfaces, so a worker scaling one never
+        holds a lock on a surface this blits from.
+        """
+        if level == 0:
+            return self.surface.subsurface(rect)
+
+        tiles = list(self.tiles_in(rect))
+        if len(tiles) == 1:
+            # Entirely inside one tile: no need to assemble anything
+            tile_x, tile_y = tiles[0]
+            origin = self.tile_rect(level, tile_x, tile_y).topleft
+            return self.tile(level, tile_x, tile_y).subsurface(rect.move(-origin[0], -origin[1]))
+
+        region = pygame.Surface(rect.size, 0, self.surface)
+        for tile_x, tile_y in tiles:
+            tile_rect = self.tile_rect(level, tile_x, tile_y)
+            area = tile_rect.clip(rect)
+            region.blit(self.tile(level, tile_x, tile_y).subsurface(area.move(-tile_rect.x, -tile_rect.y)),
+                        (area.x - rect.x, area.y - rect.y))
+        return region
@@ -1,4 +1,5 @@
 import pygame
+from text_cache import render_text
 
 
 class Button:
@@ -18,8 +19,7 @@ class Button:
         else:
             color = self.hover_color if self.is_hovered else self.color
         pygame.draw.rect(screen, color, self.rect)
-        font = pygame.font.Font(None, 24)
-        text_surface = font.render(self.text, True, (255, 255, 255))
+        text_surface = render_text(self.text, 24, (255, 255, 255))
         text_rect = text_surface.get_rect(center=self.rect.center)
         screen.blit(text_surface, text_rect)
 
@@ -53,8 +53,7 @@ class Dropdown:
 
         # Draw main button
         pygame.draw.rect(screen, self.color, self.rect)
-        font = pygame.font.Font(None, 24)
-        text = font.render(self.options[self.selected_index], True, (255, 255, 255))
+        text = render_text(self.options[self.selected_index], 24, (255, 255, 255))
         text_rect = text.get_rect(center=self.rect.center)
         screen.blit(text, text_rect)
 
@@ -74,7 +73,7 @@ class Dropdown:
                     )
                     color = self.hover_color if i == self.hover_index else self.color
                     pygame.draw.rect(screen, color, option_rect)
-                    text = font.render(option, True, (255, 255, 255))
+                    text = render_text(option, 24, (255, 255, 255))
                     text_rect = text.get_rect(center=option_rect.center)
                     screen.blit(text, text_rect)
 
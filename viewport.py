@@ -0,0 +1,145 @@
+import numpy as np
+
+
+class Viewport:
+    """Owns zoom and pan, and the map <-> screen transform they define
+
+    A map pixel (x, y) lands on screen at (x * zoom + origin_x, y * zoom + origin_y),
+    where the origin centres the scaled map on screen shifted by the offsets.
+    The transform is cached until zoom, offset, map size or screen size change.
+    """
+
+    def __init__(self, map_size, screen_size, min_zoom=0.2, max_zoom=1.5):
+        self.map_size = map_size
+        self.screen_size = screen_size
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self._zoom = 1.0
+        self._x_offset = 0
+        self._y_offset = 0
+        self._transform = None
+
+    def invalidate(self):
+        self._transform = None
+
+    @property
+    def zoom(self):
+        return self._zoom
+
+    @zoom.setter
+    def zoom(self, value):
+        self._zoom = value
+        self._transform = None
+
+    @property
+    def x_offset(self):
+        return self._x_offset
+
+    @x_offset.setter
+    def x_offset(self, value):
+        self._x_offset = value
+        self._transform = None
+
+    @property
+    def y_offset(self):
+        return self._y_offset
+
+    @y_offset.setter
+    def y_offset(self, value):
+        self._y_offset = value
+        self._transform = None
+
+    def set_map_size(self, map_size):
+        self.map_size = map_size
+        self._transform = None
+
+    def set_screen_size(self, screen_size):
+        self.screen_size = screen_size
+        self._transform = None
+
+    @property
+    def scaled_size(self):
+        return (int(self.map_size[0] * self._zoom), int(self.map_size[1] * self._zoom))
+
+    @property
+    def transform(self):
+        """(scale, origin_x, origin_y) of the current map -> screen transform"""
+        if self._transform is None:
+            scaled_width, scaled_height = self.scaled_size
+            self._transform = (
+                self._zoom,
+                self.screen_size[0] // 2 - scaled_width // 2 + self._x_offset,
+                self.screen_size[1] // 2 - scaled_height // 2 + self._y_offset
+            )
+        return self._transform
+
+    @property
+    def origin(self):
+        return self.transform[1:]
+
+    @property
+    def state(self):
+        return (self._zoom, self._x_offset, self._y_offset)
+
+    def map_to_screen(self, points):
+        """Transform an (N, 2) array of map points to integer screen coordinates"""
+        scale, origin_x, origin_y = self.transform
+        return np.floor(np.asarray(points, dtype=np.float64) * scale + (origin_x, origin_y)).astype(np.int64)
+
+    def screen_to_map(self, points):
+        """Transform an (N, 2) array of screen points to map coordinates"""
+        scale, origin_x, origin_y = self.transform
+        return (np.asarray(points, dtype=np.float64) - (origin_x, origin_y)) / scale
+
+    def map_to_screen_point(self, point):
+        scale, origin_x, origin_y = self.transform
+        return (int(origin_x + point[0] * scale), int(origin_y + point[1] * scale))
+
+    def screen_to_map_point(self, point):
+        scale, origin_x, origin_y = self.transform
+        return ((point[0] - origin_x) / scale, (point[1] - origin_y) / scale)
+
+    def constrain(self):
+        """Keep the map covering the screen, or centred when it is smaller"""
+        scaled_width, scaled_height = self.scaled_size
+        screen_width, screen_height = self.screen_size
+
+        min_x_offset = -(scaled_width - screen_width) // 2
+        max_x_offset = (scaled_width - screen_width) // 2
+        min_y_offset = -(scaled_height - screen_height) // 2
+        max_y_offset = (scaled_height - screen_height) // 2
+
+        if scaled_width < screen_width:
+            self.x_offset = 0
+        else:
+            self.x_offset = max(min_x_offset, min(self._x_offset, max_x_offset))
+
+        if scaled_height < screen_height:
+            self.y_offset = 0
+        else:
+            self.y_offset = max(min_y_offset, min(self._y_offset, max_y_offset))
+
+    def pan(self, dx, dy):
+        self.x_offset = self._x_offset + dx
+        self.y_offset = self._y_offset + dy
+        self.constrain()
+
+    def zoom_by(self, delta):
+        """Change zoom by delta, keeping the point at the screen centre fixed"""
+        self.zoom_to(self._zoom + delta)
+
+    def zoom_to(self, zoom):
+        """Set zoom, clamped to the allowed range, keeping the point at the screen centre fixed"""
+        old_zoom = self._zoom
+        self.zoom = max(self.min_zoom, min(self.max_zoom, zoom))
+
+        # Adjust offset to maintain center point
+        scale_factor = self._zoom / old_zoom
+        self.x_offset = round(self._x_offset * scale_factor)
+        self.y_offset = round(self._y_offset * scale_factor)
+        self.constrain()
+
+    def reset(self):
+        self.zoom = 1.0
+        self.x_offset = 0
+        self.y_offset = 0
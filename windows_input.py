@@ -5,7 +5,22 @@ import win32file
 from ctypes import *
 from ctypes.wintypes import *
 import pygame
-import time
+from input_backend import InputBackend
+
+
+# Pygame key codes that have a Windows virtual key equivalent
+PYGAME_TO_VK = {
+    pygame.K_LEFT: win32con.VK_LEFT,
+    pygame.K_RIGHT: win32con.VK_RIGHT,
+    pygame.K_UP: win32con.VK_UP,
+    pygame.K_DOWN: win32con.VK_DOWN,
+    pygame.K_PLUS: win32con.VK_ADD,
+    pygame.K_KP_PLUS: win32con.VK_ADD,
+    pygame.K_MINUS: win32con.VK_SUBTRACT,
+    pygame.K_KP_MINUS: win32con.VK_SUBTRACT,
+    pygame.K_r: 0x52,  # ASCII code for 'R'
+    pygame.K_ESCAPE: win32con.VK_ESCAPE
+}
 
 
 class KBDLLHOOKSTRUCT(Structure):
@@ -18,55 +33,38 @@ class KBDLLHOOKSTRUCT(Structure):
     ]
 
 
-class WindowsInputHandler:
+class WindowsInputHandler(InputBackend):
+    """Input through a global low-level keyboard hook, so keys work while IL-2 has focus"""
+
     def __init__(self, map_viewer):
-        self.map_viewer = map_viewer
-        self.handlers = {}
-        self.running = True
         self.hook = None
         self.pointer = None
+        super().__init__(map_viewer)
 
-        # Joystick handling
-        self.joysticks = {}
-        self.last_joystick_update = time.time()
-        self.initial_button_states = {}
-        self.update_joysticks()
-
-    def update_joysticks(self):
-        """Update the list of connected joysticks"""
-        try:
-            for i in range(pygame.joystick.get_count()):
-                if i not in self.joysticks:
-                    joy = pygame.joystick.Joystick(i)
-                    joy.init()
-                    self.joysticks[i] = {
-                        "joystick": joy,
-                        "num_buttons": joy.get_numbuttons()
-                    }
-        except Exception as e:
-            print(f"Error updating joysticks: {e}")
-
-    def get_initial_button_states(self):
-        """Get the initial state of all joystick buttons"""
-        self.initial_button_states.clear()
-        for joy_id, joy_info in self.joysticks.items():
-            joy = joy_info["joystick"]
-            self.initial_button_states[joy_id] = {}
-            for b in range(joy.get_numbuttons()):
-                self.initial_button_states[joy_id][b] = joy.get_button(b)
-
-    def register_key_handler(self, vk_code, callback):
-        """Register a callback for a specific virtual key code"""
-        self.handlers[vk_code] = callback
+    def key_code(self, pygame_key):
+        return PYGAME_TO_VK.get(pygame_key)
 
     def hook_proc(self, nCode, wParam, lParam):
-        """Windows hook procedure for keyboard"""
+        """Windows hook procedure for keyboard
+
+        Tracks which bound keys are held and queues each one's action on
+        its first press; auto-repeats are ignored, as held pans and zooms
+        are read from that state each frame.
+        """
         try:
-            if nCode >= 0 and wParam == win32con.WM_KEYDOWN:
+            if nCode >= 0 and wParam in (win32con.WM_KEYDOWN, win32con.WM_SYSKEYDOWN,
+                                         win32con.WM_KEYUP, win32con.WM_SYSKEYUP):
                 kb = cast(lParam, POINTER(KBDLLHOOKSTRUCT)).contents
-                vk_code = kb.vkCode
-                if vk_code in self.handlers:
-                    self.handlers[vk_code]()
+                action = self.key_actions.get(kb.vkCode)
+                if action:
+                    # Runs on the hook thread: swap in whole sets so the main
+                    # loop never iterates one that is changing, and only queue
+                    # actions for the main loop to apply
+                    if wParam in (win32con.WM_KEYUP, win32con.WM_SYSKEYUP):
+                        self.held_keys = self.held_keys - {kb.vkCode}
+                    elif kb.vkCode not in self.held_keys:
+                        self.held_keys = self.held_keys | {kb.vkCode}
+                        self.push_press(action)
         except Exception as e:
             print(f"Error in hook_proc: {e}")
         return windll.user32.CallNextHookEx(self.hook, nCode, wParam, lParam)
@@ -89,99 +87,29 @@ class WindowsInputHandler:
         if not self.hook:
             raise WinError()
 
-    def handle_input(self):
-        """Handle joystick and keyboard inputs"""
-        current_time = time.time()
-        if current_time - self.last_joystick_update > 5:
-            self.update_joysticks()
-            self.last_joystick_update = current_time
-
-        # Direct keyboard state checking
+    def poll_keyboard(self):
+        # The hook already tracks key presses and releases; polling the
+        # keyboard as well would fire every press twice
+        if self.hook:
+            return
         key_state = win32api.GetKeyState
-        keybinds = self.map_viewer.settings.settings["keybinds"]
-
-        for action, bind in keybinds.items():
-            if bind["type"] == "keyboard":
-                vk_code = self.map_viewer.pygame_to_vk(bind["value"])
-                if vk_code and key_state(vk_code) < 0:  # Key is pressed
-                    self.map_viewer.handle_action(action)
-            elif bind["type"] == "joystick":
-                try:
-                    joy = self.joysticks[bind["joy_id"]]["joystick"]
-                    if joy.get_button(bind["value"]):
-                        self.map_viewer.handle_action(action)
-                except Exception:
-                    continue
-    def wait_for_keybind(self, key_to_bind):
-        """Wait for a key or button press to create a new keybinding"""
-        # Temporarily stop the global hook
-        self.stop()
-
-        waiting = True
-        font = pygame.font.Font(None, 36)
-        prompt = font.render(f"Press key or button for {key_to_bind} (ESC to cancel)...", True, (255, 255, 255))
-        prompt_rect = prompt.get_rect(center=(self.map_viewer.screen_width // 2, self.map_viewer.screen_height // 2))
-
-        # Update joysticks and get initial states
-        self.update_joysticks()
-
-        # Display "Getting ready..." message
-        ready_prompt = font.render("Getting ready...", True, (255, 255, 255))
-        ready_rect = ready_prompt.get_rect(
-            center=(self.map_viewer.screen_width // 2, self.map_viewer.screen_height // 2))
-        self.map_viewer.screen.fill((0, 0, 0))
-        self.map_viewer.screen.blit(ready_prompt, ready_rect)
-        pygame.display.flip()
-
-        # Wait a moment and get initial button states
-        pygame.time.wait(500)
-        self.get_initial_button_states()
-
-        while waiting:
-            self.map_viewer.screen.fill((0, 0, 0))
-            self.map_viewer.screen.blit(prompt, prompt_rect)
-            pygame.display.flip()
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    waiting = False
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        waiting = False
-                    else:
-                        self.map_viewer.settings.settings["keybinds"][key_to_bind] = {
-                            "type": "keyboard",
-                            "value": event.key
-                        }
-                        self.map_viewer.settings.save_settings()
-                        waiting = False
-                elif event.type == pygame.JOYBUTTONDOWN:
-                    # Check if this button was initially pressed
-                    if not self.initial_button_states.get(event.joy, {}).get(event.button, False):
-                        self.map_viewer.settings.settings["keybinds"][key_to_bind] = {
-                            "type": "joystick",
-                            "joy_id": event.joy,
-                            "value": event.button
-                        }
-                        self.map_viewer.settings.save_settings()
-                        waiting = False
-
-        # Restart the global hook and reset the handlers
-        self.start()
-        self.map_viewer.setup_global_input_handlers()
-
-    def stop(self):
-        """Stop the keyboard hook and cleanup joysticks"""
+        held_keys = set()
+        for vk_code, action in self.key_actions.items():
+            if key_state(vk_code) < 0:  # Key is pressed
+                held_keys.add(vk_code)
+                if vk_code not in self.held_keys:
+                    self.push_press(action)
+        self.held_keys = held_keys
+
+    def suspend(self):
+        """Remove the keyboard hook"""
+        super().suspend()
         if self.hook:
             windll.user32.UnhookWindowsHookEx(self.hook)
             self.hook = None
             self.pointer = None
 
-        # Cleanup joysticks
-        for joy_id in self.joysticks:
-            try:
-                self.joysticks[joy_id]["joystick"].quit()
-            except:
-                pass
-        self.joysticks.clear()
-        self.initial_button_states.clear()
\ No newline at end of file
+    def stop(self):
+        """Stop the keyboard hook and close joysticks"""
+        self.suspend()
+        super().stop()